@@ -1,23 +1,60 @@
 """
 Nuitka build script.
 Compiles 2 separate executables for GUI and CLI.
+
+Usage:
+    python build_exe.py [--dev] [--parallel] [--cli-standalone]
+
+    --dev             Skip link-time optimization for faster local rebuilds.
+    --parallel        Build GUI and CLI at the same time (needs plenty of RAM).
+    --cli-standalone  Build the CLI as a folder instead of a single .exe.
+
+Build modes:
+    onefile     Default, used for release downloads. A single self-extracting
+                .exe that unpacks itself to a temp dir on every launch.
+    standalone  CLI only. An unpacked dist/run_app_cli.dist/ folder with
+                fictionpub_cli.exe inside. Starts much faster, which matters
+                when the CLI is called repeatedly from scripts.
+
+Set FP_LTO=yes|no|auto to choose the LTO mode of regular builds (default: auto).
+
+C compiler output is cached (ccache for gcc/clang, Nuitka's bundled clcache
+for MSVC) under FP_BUILD_CACHE (default: ~/.cache/fictionpub-build).
+Persist that directory between CI runs to get fast incremental builds.
 """
 
+import argparse
+import concurrent.futures
+import os
 import pathlib
 import re
+import shutil
 import subprocess
 import sys
 
-from setuptools_scm import get_version
+
+def get_raw_version() -> str:
+    """
+    Get the package version string.
+    Prefers fictionpub/_version.py, written by setuptools_scm on install,
+    and only queries git when that file is missing.
+    Reinstall (pip install -e .) to refresh the version after new commits/tags.
+    """
+    try:
+        from fictionpub._version import version
+        return version
+    except ImportError:
+        from setuptools_scm import get_version
+
+        root = pathlib.Path(__file__).parent
+        return get_version(
+            root=root, version_scheme="post-release", local_scheme="no-local-version"
+        )
 
 
 def get_version_tuple():
     """Get sanitized version tuple for Windows exe metadata."""
-    root = pathlib.Path(__file__).parent
-
-    raw_version = get_version(
-        root=root, version_scheme="post-release", local_scheme="no-local-version"
-    )
+    raw_version = get_raw_version()
     print("Raw version:", raw_version)
 
     # Extract numeric parts only
@@ -39,10 +76,8 @@ build_options = [
     "--file-description=FB2 to EPUB converter",
     f"--file-version={VERSION}",
     f"--product-version={VERSION}",
-    "--onefile",  # Single .exe
     "--standalone",
     "--output-dir=./dist/",
-    "--lto=yes",
     "--static-libpython=auto",
     "--follow-imports",
     "--assume-yes-for-downloads",
@@ -52,6 +87,33 @@ build_options = [
     # "--mingw64",
 ]
 
+# Full LTO multiplies link time for little runtime gain in this app.
+# "auto" lets Nuitka decide per compiler; use FP_LTO=yes for release builds.
+LTO_MODE = os.environ.get("FP_LTO", "auto")
+
+
+def lto_option(dev: bool) -> str:
+    """Returns the Nuitka LTO flag. Dev builds never use LTO."""
+    return "--lto=no" if dev else f"--lto={LTO_MODE}"
+
+
+BUILD_CACHE_DIR = pathlib.Path(
+    os.environ.get("FP_BUILD_CACHE", pathlib.Path.home() / ".cache" / "fictionpub-build")
+)
+
+
+def setup_compiler_cache():
+    """Points Nuitka and ccache at a persistent cache directory. Existing env vars win."""
+    # Nuitka keeps its own caches here, including clcache results for MSVC
+    os.environ.setdefault("NUITKA_CACHE_DIR", str(BUILD_CACHE_DIR / "nuitka"))
+    os.environ.setdefault("CCACHE_DIR", str(BUILD_CACHE_DIR / "ccache"))
+
+    ccache = shutil.which("ccache")
+    if ccache:
+        os.environ.setdefault("NUITKA_CCACHE_BINARY", ccache)
+        print("Using ccache:", ccache)
+
+
 PLUGIN_EXCLUDES = [
     # "PIL.BmpImagePlugin",
     "PIL.DdsImagePlugin",
@@ -74,40 +136,52 @@ PLUGIN_EXCLUDES = [
     "PIL.ImageFont",
 ]
 
+# GUI-only modules. The CLI entry point never imports them, and the
+# Tk-dependent icon loading lives in loader_gui.py, apart from loader.py.
+# PIL.Image itself stays: BinaryInfo uses it to read image dimensions.
 PLUGIN_EXCLUDES_CLI = [
     "tkinter",
     "tkinterdnd2",
+    "PIL.ImageTk",
+    "fictionpub.gui",
+    "fictionpub.resources.loader_gui",
 ]
 
 exclude_options = [f"--nofollow-import-to={module}" for module in PLUGIN_EXCLUDES]
-
-# TODO: Remove tkinter and PIL from CLI build
-# Breaks loader.py which does `from PIL import Image, ImageTk` at top level
-# exclude_options_cli = [f"--nofollow-import-to={module}" for module in PLUGIN_EXCLUDES_CLI]
+exclude_options_cli = [f"--nofollow-import-to={module}" for module in PLUGIN_EXCLUDES_CLI]
 
 
-def compile_cli():
+def compile_cli(dev: bool = False, onefile: bool = True):
     print("\n--- Building CLI Version ---")
     options = (
         build_options
         + exclude_options
+        + exclude_options_cli
+        + (["--onefile"] if onefile else [])    # Single .exe
         + [
+            lto_option(dev),
             "--output-filename=fictionpub_cli.exe",
             "--windows-icon-from-ico=fictionpub/resources/icons/app_cli.ico",
             "--windows-console-mode=force",  # Force console for CLI
-            "--enable-plugin=tk-inter",  # TODO: remove
             "run_app_cli.py",
         ]
     )
     subprocess.check_call([sys.executable, "-m", "nuitka"] + options)
 
 
-def compile_gui():
+def compile_cli_standalone(dev: bool = False):
+    """Builds the CLI as an unpacked folder, skipping onefile extraction at startup."""
+    compile_cli(dev, onefile=False)
+
+
+def compile_gui(dev: bool = False):
     print("\n--- Building GUI Version ---")
     options = (
         build_options
         + exclude_options
         + [
+            "--onefile",  # Single .exe
+            lto_option(dev),
             "--output-filename=fictionpub.exe",
             "--windows-icon-from-ico=fictionpub/resources/icons/app.ico",
             "--windows-console-mode=disable",  # Hide console for GUI
@@ -118,6 +192,42 @@ def compile_gui():
     subprocess.check_call([sys.executable, "-m", "nuitka"] + options)
 
 
+# Each Nuitka process can take several GB; only run two at once above this
+PARALLEL_MIN_RAM = 16 * 2**30
+
+
+def has_ram_for_parallel() -> bool:
+    """Checks available memory with psutil, if it's installed."""
+    try:
+        import psutil   # type: ignore[import-untyped]
+    except ImportError:
+        print("psutil is not installed, skipping the free memory check.")
+        return True
+    return psutil.virtual_memory().available > PARALLEL_MIN_RAM
+
+
 if __name__ == "__main__":
-    compile_gui()
-    compile_cli()
+    parser = argparse.ArgumentParser(description="Build fictionpub executables with Nuitka.")
+    parser.add_argument("--dev", action="store_true", help="Disable LTO for faster local builds.")
+    parser.add_argument("--parallel", action="store_true", help="Build GUI and CLI concurrently.")
+    parser.add_argument("--cli-standalone", action="store_true",
+                        help="Build the CLI as a folder for fast startup instead of a single .exe.")
+    args = parser.parse_args()
+
+    build_cli = compile_cli_standalone if args.cli_standalone else compile_cli
+
+    setup_compiler_cache()
+
+    if args.parallel and not has_ram_for_parallel():
+        print("Not enough free memory for a parallel build. Building sequentially.")
+        args.parallel = False
+
+    if args.parallel:
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            futures = [executor.submit(compile_gui, args.dev), executor.submit(build_cli, args.dev)]
+            # Re-raise the first build failure
+            for future in futures:
+                future.result()
+    else:
+        compile_gui(dev=args.dev)
+        build_cli(dev=args.dev)
@@ -4,6 +4,9 @@ This is the entry point for the console script.
 """
 import argparse
 import logging
+import os
+import sys
+from collections.abc import Iterator
 from pathlib import Path
 
 from .core.batch_processor import BatchProcessor
@@ -14,6 +17,9 @@ from .utils.logger import setup_main_logger  # Import the new setup function
 # Get logger (will be configured in run_cli)
 log = logging.getLogger("fb2_converter")
 
+# Input file extensions accepted for conversion
+FB2_EXTENSIONS = (".fb2", ".fb2.zip")
+
 
 def int_in_range(min_val, max_val):
     """Checks if value is an int in [min_val, max_val] range."""
@@ -25,14 +31,26 @@ def int_in_range(min_val, max_val):
         return ivalue
     return checker
 
-def int_tuple():
-    """Checks if value is an (int, int) tuple."""
-    def checker(value):
-        tvalue = tuple(int(v.strip()) for v in value.split(','))
-        if len(tvalue) != 2:
-            raise argparse.ArgumentTypeError(f"Value must be a comma separated (int, int) tuple, got {tvalue}")
-        return tvalue
-    return checker
+def int_tuple(value: str) -> tuple[int, int]:
+    """Parses a comma separated 'int,int' pair."""
+    first, sep, second = value.partition(',')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Value must be a comma separated (int, int) tuple, got {value!r}")
+    # int() ignores surrounding whitespace and rejects a third value
+    return int(first), int(second)
+
+
+def _walk(root: Path) -> Iterator[Path]:
+    """Recursively yields .fb2 and .fb2.zip files under root in a single scan."""
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _walk(Path(entry.path))
+                elif entry.is_file() and entry.name.lower().endswith(FB2_EXTENSIONS):
+                    yield Path(entry.path)
+    except OSError as e:
+        log.warning("Cannot scan directory, skipping: %s (%s)", root, e)
 
 
 def run_cli():
@@ -57,30 +75,35 @@ def run_cli():
     parser.add_argument("-c", "--css", type=Path, default=None, 
                         help="Path to a custom CSS file.")
     parser.add_argument("-typ", "--typography", action="store_true", help="Enable typography post-processing.")
-    parser.add_argument("-typ-nbsp", type=int_tuple(), default=(1, 1), help="Typography: word length range to add NBSP (int, int).")
-    parser.add_argument("-typ-nobr", type=int_tuple(), default=(4, 6), help="Typography: word length range to wrap in <span>.nobreak (int, int).")
+    parser.add_argument("-typ-nbsp", type=int_tuple, default=(1, 1), help="Typography: word length range to add NBSP (int, int).")
+    parser.add_argument("-typ-nobr", type=int_tuple, default=(4, 6), help="Typography: word length range to wrap in <span>.nobreak (int, int).")
     parser.add_argument("--threads", type=int, default="0", 
                         help="Number of parallel threads to use for conversion. 0 to use max.")
 
     args = parser.parse_args()
+
+    # stdout is block-buffered when piped; keep progress lines appearing as they come
+    if not sys.stdout.isatty():
+        sys.stdout.reconfigure(line_buffering=True)  # type: ignore[union-attr]
     
     console_level = logging.ERROR
     setup_main_logger(console_level)
-    log.info(f"Console logger set to level: {logging.getLevelName(console_level)}")
+    log.info("Console logger set to level: %s", logging.getLevelName(console_level))
 
     # Collect all files to be processed
     files_to_process = []
     for path in args.input_paths:
         if not path.exists():
-            log.warning(f"Input path does not exist, skipping: {path}")
+            log.warning("Input path does not exist, skipping: %s", path)
             continue
         if path.is_dir():
-            for ext in ("**/*.fb2", "**/*.fb2.zip"):
-                files_to_process.extend(path.rglob(ext))
-        elif path.is_file() and path.suffix in ['.fb2', '.zip']:
-            filename = str(path)
-            if filename.endswith('.fb2') or filename.endswith('.fb2.zip'):
-                files_to_process.append(path)
+            files_to_process.extend(_walk(path))
+        elif path.is_file() and path.name.lower().endswith(FB2_EXTENSIONS):
+            files_to_process.append(path)
+
+    # Drop duplicates from overlapping inputs (e.g. a folder and a file inside it).
+    # Sorting keeps the batch order deterministic and groups files by folder.
+    files_to_process = sorted({p.resolve() for p in files_to_process})
 
     if not files_to_process:
         log.warning("No .fb2 or .fb2.zip files found to process.")
@@ -101,7 +124,7 @@ def run_cli():
     processor = BatchProcessor(config)
 
     num_files = len(files_to_process)
-    log.info(f"Found {len(files_to_process)} files. Starting conversion...")
+    log.info("Found %d files. Starting conversion...", num_files)
     
     completed_count = 0
     def progress_callback(path: Path, result: Path | None, exc: Exception | None):
@@ -111,15 +134,17 @@ def run_cli():
         completed_str = str(completed_count).rjust(len(str(num_files)))
         prefix = f"[{completed_str}/{num_files}]"
         if exc:
-            print(f"{prefix} ❌ Error: {path.name}", flush=True)
-            print(f"  └─ {exc}", flush=True)
+            print(f"{prefix} ❌ Error: {path.name}")
+            print(f"  └─ {exc}")
+            sys.stdout.flush()  # Errors are shown right away
             # Also log the error to file/console handlers
             # Set exc_info=False to avoid duplicate stack trace on console
             # (file log will have full trace from worker)
-            log.error(f"Failed to convert {path.name}: {exc}", exc_info=False) 
+            log.error("Failed to convert %s: %s", path.name, exc, exc_info=False) 
         else:
-            print(f"{prefix} ✅ Done: {path.name}", flush=True)
+            print(f"{prefix} ✅ Done: {path.name}")
     
     processor.run(files_to_process, progress_callback)
 
     print("\nBatch conversion finished.")
+    sys.stdout.flush()
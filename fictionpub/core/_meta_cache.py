@@ -0,0 +1,107 @@
+"""
+Persistent on-disk cache for FB2Book.get_quick_metadata() results.
+
+Entries are keyed by file path and are valid while the file's mtime and size
+stay the same. The cache is best effort: any sqlite error is logged and
+treated as a cache miss.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+log = logging.getLogger("fb2_converter")
+
+CACHE_FILENAME = "meta_cache.sqlite3"
+# Oldest entries are evicted (FIFO) above this count
+MAX_ENTRIES = 50_000
+# Stored as PRAGMA user_version. Bump it when the table or the extracted metadata changes:
+# a cache with another version is cleared on connect.
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER,
+    size INTEGER,
+    author TEXT,
+    title TEXT,
+    year TEXT,
+    lang TEXT
+)
+"""
+
+# sqlite connections can't be shared between threads; the GUI reads metadata in a thread pool
+_local = threading.local()
+
+
+def _cache_path() -> Path:
+    """Returns the cache file path. Resolved on first connect, Path.home() raises without a home directory."""
+    base = os.environ.get("LOCALAPPDATA") or Path.home() / ".cache"
+    return Path(base) / "fictionpub" / CACHE_FILENAME
+
+
+def _connect() -> sqlite3.Connection | None:
+    """Returns this thread's connection, opening it on first use. None if the cache is unavailable."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None or getattr(_local, 'failed', False):
+        return conn
+
+    try:
+        cache_path = _cache_path()
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(cache_path, isolation_level=None, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Checked and upgraded in one write transaction, other processes may be connecting too
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS meta")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(_SCHEMA)
+        conn.execute("COMMIT")
+        # Rows are re-inserted on update, so the lowest rowids are the oldest entries
+        conn.execute(
+            "DELETE FROM meta WHERE rowid <= (SELECT MAX(rowid) FROM meta) - ?", (MAX_ENTRIES,))
+    except (sqlite3.Error, OSError, RuntimeError) as e:
+        log.debug(f"Metadata cache unavailable: {e}")
+        _local.failed = True
+        return None
+
+    _local.conn = conn
+    return conn
+
+
+def lookup(filepath: Path, st: os.stat_result) -> tuple[str, str, str, str] | None:
+    """Returns cached (author, title, year, lang) if the file hasn't changed since it was stored."""
+    conn = _connect()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute(
+            "SELECT mtime, size, author, title, year, lang FROM meta WHERE path = ?",
+            (os.path.abspath(filepath),)
+        ).fetchone()
+    except sqlite3.Error as e:
+        log.debug(f"Metadata cache lookup failed: {e}")
+        return None
+
+    if row is None or row[0] != st.st_mtime_ns or row[1] != st.st_size:
+        return None
+    return row[2:]
+
+
+def store(filepath: Path, st: os.stat_result, meta: tuple[str, str, str, str]):
+    """Saves (author, title, year, lang) of a file."""
+    conn = _connect()
+    if conn is None:
+        return
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(filepath), st.st_mtime_ns, st.st_size, *meta)
+        )
+    except sqlite3.Error as e:
+        log.debug(f"Metadata cache update failed: {e}")
@@ -3,9 +3,8 @@ Handles the parallel processing of a batch of files.
 This class contains the ThreadPoolExecutor and is used by both the CLI and GUI.
 """
 import logging
-import time
-import os
 import concurrent.futures
+import dataclasses
 from pathlib import Path
 from typing import Callable
 
@@ -13,23 +12,42 @@ from .pipeline import ConversionPipeline
 from ..terms.localized_terms import LocalizedTerms
 from ..utils.config import ConversionConfig
 from ..utils.logger import setup_worker_logger
+from ..utils.mp import available_cpus, get_mp_context
 
 # The main logger is configured by the entry point (CLI/GUI)
 # We just get it here to write high-level status updates from the main process
 log = logging.getLogger("fb2_converter")
 
+# Workers are replaced after converting about this many files to keep lxml/PIL memory bounded
+FILES_PER_CHILD = 64
 
-def _init_worker(genres, headings):
+
+# Per-process pipeline, created once by _init_worker and reused for every file
+_PIPELINE: ConversionPipeline | None = None
+
+
+def _init_worker(genres, headings, config: ConversionConfig):
     """
     This function runs once inside every new child process.
     It receives the data and injects it into the local class.
+    The pipeline is built once per worker, so tasks only need to carry a path.
     """
+    global _PIPELINE
     LocalizedTerms.inject_terms((genres, headings))
+    _PIPELINE = ConversionPipeline(config)
+
 
+def _convert_chunk(paths: list[Path]) -> list[tuple[Path, str, Exception | None]]:
+    """
+    The target for the executor. Converts a group of files in one task,
+    so IPC and scheduling costs are paid per chunk rather than per file.
+    Returns a list of _convert_single_file() results in the same order.
+    """
+    return [_convert_single_file(path) for path in paths]
 
-def _convert_single_file(path: Path, config: ConversionConfig) -> tuple[Path, str, Exception | None]:
+
+def _convert_single_file(path: Path) -> tuple[Path, str, Exception | None]:
     """
-    A standalone function to be the target for the executor.
     It runs the full conversion pipeline on a single file and
     captures all its log output.
 
@@ -44,19 +62,18 @@ def _convert_single_file(path: Path, config: ConversionConfig) -> tuple[Path, st
     worker_log = logging.getLogger("fb2_converter")
 
     try:
-        worker_log.info(f"Converting: {path.name}")
+        worker_log.info("Converting: %s", path.name)
         
         # Main Conversion Logic
-        pipeline = ConversionPipeline(config)
-        pipeline.convert(path)
+        _PIPELINE.convert(path)     # type: ignore[union-attr]
         
-        worker_log.info(f"Successfully finished conversion for: {path.name}")
+        worker_log.info("Successfully finished conversion for: %s", path.name)
         return path, log_stream.getvalue(), None
 
     except Exception as e:
         # 1. Log the full traceback locally to the worker's buffer. 
         # This ensures the details are saved to the log file later.
-        worker_log.error(f"Failed conversion for: {path.name}", exc_info=True)
+        worker_log.error("Failed conversion for: %s", path.name, exc_info=True)
 
         # 2. Sanitize the exception.
         # Convert the exception to a built-in type with the string message.
@@ -77,8 +94,6 @@ class BatchProcessor:
 
     def __init__(self, config: ConversionConfig):
         self.config = config
-        import pickle
-        pickle.dumps(self.config)
 
 
     def run(self, files: list[Path], progress_callback: Callable | None = None):
@@ -90,38 +105,56 @@ class BatchProcessor:
             progress_callback: A function to be called as each file completes.
                                It receives the (path, result, exception).
         """
-        # Determine the number of worker threads
+        # Determine the number of worker processes.
+        # Conversion is CPU-bound: one worker per usable core, never more than files.
         th = self.config.num_threads
-        max_workers = th if th > 0 else (os.cpu_count() or 1)
+        max_workers = th if th > 0 else max(1, min(len(files), available_cpus()))
         print(f"\nStarting batch processing with up to {max_workers} worker threads.", flush=True)
 
-        # Map paths to their original index to maintain order
-        path_to_index = {path: i for i, path in enumerate(files)}
-        
         # This list will store results in the original file order
         # Each item will be: (path, log_string, exception)
         ordered_results: list[tuple[Path, str, Exception | None] | None] = [None] * len(files)
 
+        # Hand out files in chunks to cut per-task IPC overhead on large batches.
+        # Several chunks per worker keep the load balanced and progress updates flowing.
+        chunksize = max(1, len(files) // (max_workers * 8))
+        # (start index, paths) pairs to put results back in the original order
+        chunks = [(i, files[i:i + chunksize]) for i in range(0, len(files), chunksize)]
+        # Workers already run one per core, extra serialization threads would only oversubscribe them
+        worker_config = dataclasses.replace(self.config, serialize_threads=1)
+        # Recycling is counted in tasks, and each task is a whole chunk
+        max_tasks_per_child = max(1, FILES_PER_CHILD // chunksize)
+
         with concurrent.futures.ProcessPoolExecutor(
             max_workers,
-            initializer=_init_worker,                # Function to run on start
-            initargs=(LocalizedTerms.get_terms())   # Arguments for that function
+            # The forkserver preloads this module, and with it the whole pipeline
+            mp_context=get_mp_context([__name__]),
+            max_tasks_per_child=max_tasks_per_child,
+            initializer=_init_worker,                           # Function to run on start
+            initargs=(*LocalizedTerms.get_terms(), worker_config) # Arguments for that function
         ) as executor:
             # Submit all conversion tasks
-            future_to_path = {
-                executor.submit(_convert_single_file, path, self.config): path
-                for path in files
+            future_to_chunk = {
+                executor.submit(_convert_chunk, paths): (start, paths)
+                for start, paths in chunks
             }
 
             # Process results as they are completed
-            for future in concurrent.futures.as_completed(future_to_path):
-                path = future_to_path[future]
-                idx = path_to_index[path]
+            for future in concurrent.futures.as_completed(future_to_chunk):
+                start, paths = future_to_chunk[future]
 
                 try:
-                    # Get the worker's result: (path, log_string, exception)
-                    p, log_string, exc = future.result()
-                    ordered_results[idx] = (p, log_string, exc)
+                    # Get the worker's results: [(path, log_string, exception), ...]
+                    chunk_results = future.result()
+                except Exception as e:
+                    # This catches a critical failure *in the worker itself*.
+                    # If a process died, the pool is broken and every pending chunk ends up here.
+                    log.error("Critical worker failure for %s (+%d more): %s", paths[0].name, len(paths) - 1, e, exc_info=True)
+                    err_msg = f"CRITICAL FAILURE: {e}\n"
+                    chunk_results = [(path, err_msg, e) for path in paths]
+
+                for offset, (path, log_string, exc) in enumerate(chunk_results):
+                    ordered_results[start + offset] = (path, log_string, exc)
 
                     # Call progress callback *as items complete*
                     if progress_callback:
@@ -130,16 +163,6 @@ class BatchProcessor:
                         else:
                             progress_callback(path, path, None)
 
-                except Exception as e:
-                    # This catches a critical failure *in the worker itself*
-                    # (e.g., the process died)
-                    log.error(f"Critical worker failure for {path.name}: {e}", exc_info=True)
-                    err_msg = f"CRITICAL FAILURE: {e}\n"
-                    ordered_results[idx] = (path, err_msg, e)
-
-            # Short delay for process shutdown
-            time.sleep(0.05)
-
 
         # --- All processing is done ---
         log.info("Batch processing complete. Writing ordered logs...")
@@ -165,7 +188,7 @@ class BatchProcessor:
                     file_handler.stream.write(log_string)
                     file_handler.stream.write(f"--- End log for {path.name} ---\n")
                 except Exception as e:
-                    log.error(f"Failed to write buffered log for {path.name}: {e}")
+                    log.error("Failed to write buffered log for %s: %s", path.name, e)
 
         log.info("Ordered log writing complete.")
 
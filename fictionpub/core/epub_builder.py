@@ -2,20 +2,23 @@
 Handles the creation of the EPUB file structure and packaging.
 """
 
-import copy
+import bisect
 import logging
-import os
 import re
 import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from pathlib import Path
-from typing import NamedTuple
+from typing import Any, NamedTuple, cast
+from xml.sax.saxutils import quoteattr
 
 from lxml import etree
 
 from ..resources.loader import get_css_path
 from ..terms.localized_terms import LocalizedTerms
 from ..utils.config import ConversionConfig
+from ..utils.mp import available_cpus
 from ..utils.namespaces import Namespaces as NS
 from ..utils.opf_utils import fill_opf_metadata
 from ..utils.structures import ConvertedBody, EPUB_TYPES_MAP, FileInfo, BinaryInfo, TOCItem, FNames as FN
@@ -23,6 +26,22 @@ from ..utils.structures import ConvertedBody, EPUB_TYPES_MAP, FileInfo, BinaryIn
 
 log = logging.getLogger("fb2_converter")
 
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Namespaced attribute names in Clark notation
+EPUB_TYPE = f"{{{NS.EPUB}}}type"
+XML_LANG = f"{{{NS.XML}}}lang"
+XLINK_HREF = f"{{{NS.XLINK}}}href"
+
+# Already compressed image formats; deflating them again costs CPU for nothing
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# Deflate level for text files (zlib default)
+COMPRESS_LEVEL = 6
+
+# lxml releases the GIL while serializing, so XHTML documents are serialized in threads.
+# Upper limit when ConversionConfig.serialize_threads is 0 (auto-detect)
+MAX_SERIALIZE_THREADS = 8
+
 
 class Paths(NamedTuple):
     """Paths to directories of standard EPUB directory structure."""
@@ -53,9 +72,13 @@ class EpubBuilder:
     def __init__(self, source_path: Path, config: ConversionConfig):
         """Initializes the builder."""
         self.source_path = source_path
-        tmp: Path = source_path.parent / f"{source_path.stem}_epub_temp"
-        self.paths: Paths = Paths.from_root(tmp)
         self.config = config
+        # Files are streamed into the archive, so by default there's no workspace
+        # on disk and paths are relative: they double as archive entry names.
+        root = Path()
+        if config.keep_workspace:
+            root = source_path.parent / f"{source_path.stem}_epub_temp"
+        self.paths: Paths = Paths.from_root(root)
 
         self.metadata: dict = {}
         self.annotation_el: etree._Element | None = None
@@ -63,27 +86,34 @@ class EpubBuilder:
         self.main_docs: list[FileInfo] = []
         self.note_docs: list[FileInfo] = []
         self.doc_list: list[FileInfo] = []
+        # {id: doc} for faster lookup, filled as documents are added
+        self.doc_map: dict[str, FileInfo] = {}
         self.toc_items: list[TOCItem] = []
+        # h1..h[depth]. Deeper headings never become TOC items,
+        # so NAV/NCX generation doesn't need to check levels again.
+        self._heading_tags = frozenset(f'h{i}' for i in range(1, config.toc_depth + 1))
+        st = config.serialize_threads
+        self._serialize_threads = st if st > 0 else min(MAX_SERIALIZE_THREADS, available_cpus())
         self.id_to_doc_map: dict[str, str] = {}
-        self.local_terms: LocalizedTerms
+        # Open archive that files are streamed into; None when writing to the workspace
+        self._zip: zipfile.ZipFile | None = None
 
 
     def set_metadata(self, metadata: dict):
         """
         Receives metadata from the FB2Book.
-        Initializes LocalizedTerms with the book's language.
+        Genre keys are kept as is and translated when the OPF is written.
         """
         self.metadata = metadata
         # Lang could be undefined.
         # Let methods be aware of this and decide whether a fallback is necessary.
         self.lang: str = metadata.get('lang', '')
-        self.local_terms = LocalizedTerms(self.lang)
 
-        # With local_terms initialized, get translated genre names
-        self.metadata['genres'] = [
-            self.local_terms.get_genre(g)
-            for g in metadata['genres']
-        ]
+
+    @cached_property
+    def local_terms(self) -> LocalizedTerms:
+        """Translations for the book's language, created on first use after set_metadata()."""
+        return LocalizedTerms(self.lang)
 
 
     def set_annotation(self, converted_annotation: etree._Element | None):
@@ -105,13 +135,14 @@ class EpubBuilder:
             body.extend(list(doc.body))
             # Move all children from converted body to new html
             file_info = FileInfo(doc.file_id, doc.title, html)
-            self.doc_list.append(file_info)
+            self._add_doc(file_info)
 
 
     def add_note_docs(self, converted_docs: list[ConvertedBody]):
         """Accepts converted note bodies and adds them to the list."""
+        get_heading = self.local_terms.get_heading
         for doc in converted_docs:
-            title = self.local_terms.get_heading(doc.file_id)
+            title = get_heading(doc.file_id)
             html, body = self._create_html(doc.file_id, title)
             # Move all children from converted body to new html
             body.extend(list(doc.body))
@@ -121,58 +152,44 @@ class EpubBuilder:
             heading.text = title
             body.insert(0, heading)
             file_info = FileInfo(doc.file_id, title, html, is_note=True)
-            self.doc_list.append(file_info)
+            self._add_doc(file_info)
 
 
     def build(self):
         """
-        Generates metadata files and zips the workspace into an .epub file.
+        Generates metadata files and writes everything into an .epub file.
         add_main_docs() and add_note_docs() must be called before building.
         """
-        try:
-            self._setup_workspace()
-
-            self._create_static_docs()
-
-            # Sort doc_list according to the order attribute
-            self.doc_list.sort()
-
-            # Create an {id: doc} dictionary for faster lookup
-            self.doc_map = {doc.id: doc for doc in self.doc_list}
-
-            self._build_id_map()
-            self._resolve_internal_links()
-            self._insert_backlink_hrefs()
-            self._resolve_image_paths()
-
-            # Build nested list of headings to be used in NAV/NCX generation
-            self._build_toc()
-            self._create_nav()
-            self.doc_list.sort()    # Re-sort after adding NAV
-
-            # Generate additional files, assemble EPUB
-            self._create_ncx()
-            self._create_opf()
-            self._create_container_xml()
-            self._create_stylesheet()
-            self._write_documents()
-            self._write_binaries()
-            self._zip_epub()
-    
-            log.info("EPUB build complete.")
-        
-        finally:
-            self._cleanup_workspace()
+        self._create_static_docs()
+
+        # Sort doc_list according to the order attribute
+        self.doc_list.sort()
+
+        # IDs of all documents must be known before links can be resolved
+        self._build_id_map()
+        # Fix links and images, build nested list of headings for NAV/NCX
+        self._resolve_documents()
+        self._create_nav()
+
+        # Generate additional files, assemble EPUB
+        self._zip_epub()
+
+        log.info("EPUB build complete.")
 
 
     def _cleanup_workspace(self):
         """Removes the temporary directory."""
+        # Without a workspace, paths.root is the relative archive root, i.e. the current directory
+        if not self.config.keep_workspace:
+            return
         if self.paths.root.exists():
             shutil.rmtree(self.paths.root)
 
 
     def _setup_workspace(self):
         """Creates a clean temporary directory for EPUB contents."""
+        if not self.config.keep_workspace:
+            return
         self._cleanup_workspace()
 
         for p in self.paths:
@@ -223,7 +240,7 @@ class EpubBuilder:
             etree.SubElement(svg, 'image', attrib={
                 "width": str(width),
                 "height": str(height),
-                f'{{{NS.XLINK}}}href': img_href
+                XLINK_HREF: img_href
             })
 
         else:
@@ -321,59 +338,89 @@ class EpubBuilder:
             self._create_copyright_page(),
             self._create_annotation_page(),
         ]
-        docs = [d for d in docs if d is not None]
-        self.doc_list.extend(docs)
+        for doc in docs:
+            if doc is not None:
+                self._add_doc(doc)
 
 
-    def _build_toc(self):
+    def _add_doc(self, file_info: FileInfo):
+        """Adds a document to doc_list and doc_map."""
+        self.doc_list.append(file_info)
+        self.doc_map[file_info.id] = file_info
+
+
+    def _resolve_documents(self):
         """
-        Parses the generated XHTML content files to build a structured Table of Contents.
-        Finds heading tags, generates missing IDs, and cleans up titles that contain note links.
+        Walks every XHTML document once to resolve internal links, backlinks
+        and image paths, and to collect headings for the Table of Contents.
         """
         id_counter = 1
 
-        # h1..h[depth]
-        heading_tags = [f'h{i}' for i in range(1, self.config.toc_depth + 1)]
-        heading_query = " | ".join([f".//{tag}" for tag in heading_tags])
-
         for doc in self.doc_list:
             if not isinstance(doc.html, etree._Element):
-                log.warning(f"[build_toc]: No HTML found for {doc.filename} file. Skipping.")
+                log.warning(f"[resolve_documents]: No HTML found for {doc.filename} file. Skipping.")
                 continue
 
-            headings = doc.html.xpath(heading_query)
-
-            for heading in headings:     # type: ignore
-                heading_id = heading.get('id')
-                if not heading_id:
-                    heading_id = f"toc_id_{id_counter}"
-                    heading.set('id', heading_id)
+            headings = []
+            for el in doc.html.iter('a', 'img', *self._heading_tags):
+                if el.tag == 'a':
+                    if el.get('href') is not None:
+                        self._resolve_link(el)
+                    if doc.is_note and el.get('class') == 'backlink':
+                        self._resolve_backlink(el)
+                elif el.tag == 'img':
+                    self._resolve_image(el)
+                elif el.tag in self._heading_tags:
+                    headings.append(el)
+
+            # Headings are handled after the walk, when noterefs inside them are resolved
+            for heading in headings:
+                if not heading.get('id'):
+                    heading.set('id', f"toc_id_{id_counter}")
                     id_counter += 1
+                self._add_toc_item(doc, heading)
 
-                toc_text = ""
-                # Create a copy for modification
-                heading_clone = copy.deepcopy(heading)
+        log.info(f"Generated TOC with {len(self.toc_items)} entries from XHTML files.")
 
-                # Remove <a>.noteref and <br> elements
-                for el in heading_clone.xpath('.//a[@class="noteref"] | .//br'):
-                    parent = el.getparent()
-                    if parent is not None:
-                        parent.remove(el)
 
-                # Join text, remove newlines and collapse multiple spaces
-                toc_text = "".join(heading_clone.itertext())
-                toc_text = re.sub(r'\s+', ' ', toc_text).strip()
+    def _add_toc_item(self, doc: FileInfo, heading: etree._Element):
+        """Adds a heading to the TOC, cleaning up titles that contain note links."""
+        href = doc.href_prefix + heading.get('id', '')
+        toc_text = self._heading_text(heading)
 
-                level = int(heading.tag[-1])
+        self.toc_items.append(TOCItem(
+            level=int(heading.tag[-1]),
+            text=toc_text,
+            href_nav=href,
+            href_ncx=f"{FN.TEXT}/{href}"
+        ))
 
-                self.toc_items.append(TOCItem(
-                    level=level,
-                    text=toc_text,
-                    href_nav=f"{doc.filename}#{heading_id}",
-                    href_ncx=f"{FN.TEXT}/{doc.filename}#{heading_id}"
-                ))
 
-        log.info(f"Generated TOC with {len(self.toc_items)} entries from XHTML files.")
+    @staticmethod
+    def _heading_text(heading: etree._Element) -> str:
+        """
+        Joins the text of a heading without <br> and <a>.noteref contents.
+        Newlines are removed and multiple spaces collapsed.
+        """
+        # Most headings contain neither, so their text can be joined directly
+        if not any(el.tag == 'br' or el.get('class') == 'noteref' for el in heading.iter('br', 'a')):
+            return WHITESPACE_RE.sub(' ', "".join(heading.itertext())).strip()    # type: ignore
+
+        parts = []
+
+        def walk(el: etree._Element):
+            if el.text:
+                parts.append(el.text)
+            for child in el:
+                skip = child.tag == 'br' or (child.tag == 'a' and child.get('class') == 'noteref')
+                # Comments and PIs contribute only their tail, like itertext()
+                if isinstance(child.tag, str) and not skip:
+                    walk(child)
+                if child.tail:
+                    parts.append(child.tail)
+
+        walk(heading)
+        return WHITESPACE_RE.sub(' ', "".join(parts)).strip()
 
 
     def _create_nav(self):
@@ -387,40 +434,34 @@ class EpubBuilder:
 
         local_title = self.local_terms.get_heading('toc', "Table of Contents")
         html, body = self._create_html(fileid, local_title, add_body_type=False)
-        nav = etree.SubElement(body, "nav", attrib={f"{{{NS.EPUB}}}type": epub_type, "id": "toc"})
+        nav = etree.SubElement(body, "nav", attrib={EPUB_TYPE: epub_type, "id": "toc"})
         etree.SubElement(nav, "h1").text = local_title
 
         ol = etree.SubElement(nav, "ol")
 
-        # A list that tracks the parent <ol> for each level. level_parents[0] is the root.
-        level_parents = [ol]
+        # Parent <ol> for each nesting level, level_parents[0] is the root.
+        # Only level_parents[:depth] are in use; deeper slots are stale.
+        level_parents: list[etree._Element] = [ol] * (self.config.toc_depth + 1)
+        depth = 1
 
         for item in self.toc_items:
-            if item.level > self.config.toc_depth:
-                continue
-
-            # If we need to go deeper, create a new <ol> and add it to the list
-            if item.level > len(level_parents):
-                # Get the last <li> in the current parent <ol>
+            # If we need to go deeper, create a new <ol> under the last <li>
+            if item.level > depth:
                 # TODO: add range checks to avoid going out of bounds
-                last_li = level_parents[-1][-1]
-                ol = etree.SubElement(last_li, "ol")
-                level_parents.append(ol)
+                last_li = level_parents[depth - 1][-1]
+                level_parents[depth] = etree.SubElement(last_li, "ol")
+                depth += 1
             else:
                 # Go up in levels
-                while item.level < len(level_parents):
-                    level_parents.pop()
-                # Get last <ol>
-                ol = level_parents[-1]
+                depth = item.level
 
-            # ol is the current parent <ol>
-            li = etree.SubElement(ol, "li")
+            li = etree.SubElement(level_parents[depth - 1], "li")
             a = etree.SubElement(li, "a", href=item.href_nav)
             a.text = item.text
 
         # --- Landmarks ---
         nav_landmarks = etree.SubElement(body, "nav", attrib={
-            'id': 'landmarks', f"{{{NS.EPUB}}}type": "landmarks", 'hidden': ''
+            'id': 'landmarks', EPUB_TYPE: "landmarks", 'hidden': ''
         })
         etree.SubElement(nav_landmarks, "h1", attrib={'hidden': ''}).text = "Landmarks"
         ol_landmarks = etree.SubElement(nav_landmarks, "ol")
@@ -428,19 +469,22 @@ class EpubBuilder:
         # First, add a self-referential link to the Table of Contents
         li = etree.SubElement(ol_landmarks, "li")
         a = etree.SubElement(li, "a", href="#toc",
-                            attrib={f"{{{NS.EPUB}}}type": epub_type})
+                            attrib={EPUB_TYPE: epub_type})
         a.text = local_title
 
+        get_heading = self.local_terms.get_heading
         for doc in self.doc_list:
-            if doc.id in EPUB_TYPES_MAP:
+            structure = EPUB_TYPES_MAP.get(doc.id)
+            if structure:
                 li = etree.SubElement(ol_landmarks, "li")
-                epub_type = EPUB_TYPES_MAP[doc.id].epub_type
-                a = etree.SubElement(li, "a", href=f"{doc.filename}",
-                                    attrib={f"{{{NS.EPUB}}}type": epub_type})
-                a.text = self.local_terms.get_heading(doc.id)
+                a = etree.SubElement(li, "a", href=doc.filename,
+                                    attrib={EPUB_TYPE: structure.epub_type})
+                a.text = get_heading(doc.id)
 
         file_info = FileInfo(fileid, local_title, html, prop='nav', order=-1)    # -1 = last
-        self.doc_list.append(file_info)
+        # doc_list is already sorted, keep it that way
+        bisect.insort(self.doc_list, file_info)
+        self.doc_map[file_info.id] = file_info
 
 
     def _create_ncx(self):
@@ -460,18 +504,16 @@ class EpubBuilder:
 
         nav_map = etree.SubElement(ncx, "navMap")
 
-        # A list that tracks the parent <navPoint> for each level
-        level_parents = [nav_map]
+        # Parent <navPoint> for each nesting level, level_parents[0] is the root.
+        # Only level_parents[:depth] are in use; deeper slots are stale.
+        level_parents: list[etree._Element] = [nav_map] * (self.config.toc_depth + 1)
+        depth = 1
         play_order = 1
 
         for item in self.toc_items:
-            if item.level > self.config.toc_depth:
-                continue
-
-            while item.level < len(level_parents):
-                level_parents.pop()
-
-            parent_navpoint = level_parents[-1]
+            # Go up in levels
+            depth = min(depth, item.level)
+            parent_navpoint = level_parents[depth - 1]
 
             nav_point = etree.SubElement(parent_navpoint, "navPoint", id=f"navpoint-{play_order}", playOrder=str(play_order))
             play_order += 1
@@ -480,8 +522,9 @@ class EpubBuilder:
             etree.SubElement(nav_label, "text").text = item.text
             etree.SubElement(nav_point, "content", src=item.href_ncx)
 
-            if item.level >= len(level_parents):
-                level_parents.append(nav_point)
+            # The next item may nest under this one
+            level_parents[depth] = nav_point
+            depth += 1
 
         self._write_html(ncx, ncx_path, doctype=False)
 
@@ -494,7 +537,9 @@ class EpubBuilder:
 
         # Metadata
         meta = etree.SubElement(root, "metadata")
-        fill_opf_metadata(meta, self.metadata)
+        # Translated genre names, without touching the FB2Book's metadata
+        genres = [self.local_terms.get_genre(g) for g in self.metadata.get('genres', [])]
+        fill_opf_metadata(meta, {**self.metadata, 'genres': genres})
 
         # Set a cover image in metadata
         cover_image_id = self.metadata.get('cover-image')
@@ -510,6 +555,12 @@ class EpubBuilder:
         etree.SubElement(manifest, "item", id="ncx", href="toc.ncx", attrib={"media-type": "application/x-dtbncx+xml"})
         etree.SubElement(manifest, "item", id="css", href="Styles/style.css", attrib={"media-type": "text/css"})
 
+        # Manifest, spine and guide entries are collected as markup and parsed at once,
+        # which is much cheaper than creating hundreds of elements one by one.
+        manifest_items: list[str] = []
+        spine_items: list[str] = []
+        guide_items: list[str] = []
+
         # Add all documents from doc_map to Manifest, Spine, Guide
         for doc in self.doc_list:
             if doc is None:
@@ -517,37 +568,43 @@ class EpubBuilder:
                 continue
 
             # Manifest
-            href = f"{FN.TEXT}/{doc.filename}"
-            item = etree.SubElement(manifest, "item", id=doc.id, href=href,
-                                    attrib={"media-type": "application/xhtml+xml"})
-            if doc.prop:
-                item.set('properties', doc.prop)
+            href = quoteattr(f"{FN.TEXT}/{doc.filename}")
+            props = f" properties={quoteattr(doc.prop)}" if doc.prop else ""
+            manifest_items.append(
+                f'<item id={quoteattr(doc.id)} href={href} media-type="application/xhtml+xml"{props}/>')
 
             # Spine
-            if doc.is_note:     # ? make 'cover' non-linear as well ?
-                # Footnote bodies are non-linear
-                spine.append(etree.Element("itemref", idref=doc.id, linear="no"))
-            else:
-                spine.append(etree.Element("itemref", idref=doc.id))
+            # Footnote bodies are non-linear
+            linear = ' linear="no"' if doc.is_note else ""     # ? make 'cover' non-linear as well ?
+            spine_items.append(f"<itemref idref={quoteattr(doc.id)}{linear}/>")
 
             # Guide
-            if doc.id in EPUB_TYPES_MAP:
-                guide_type = EPUB_TYPES_MAP[doc.id].guide_type
-                etree.SubElement(guide, "reference", type=guide_type, title=doc.title, href=href)
-
+            structure = EPUB_TYPES_MAP.get(doc.id)
+            if structure:
+                guide_type = quoteattr(structure.guide_type)
+                guide_items.append(f"<reference type={guide_type} title={quoteattr(doc.title)} href={href}/>")
 
         # Add images to Manifest
         for img in self.binaries.values():
-            href = f"{FN.IMAGES}/{img.filename}"
+            href = quoteattr(f"{FN.IMAGES}/{img.filename}")
+            props = f" properties={quoteattr(img.prop)}" if img.prop else ""
             # using img.filename as ID
-            item = etree.SubElement(
-                manifest, "item", id=img.filename, href=href, attrib={"media-type": img.type})
-            if img.prop:
-                item.set('properties', img.prop)
+            manifest_items.append(
+                f"<item id={quoteattr(img.filename)} href={href} media-type={quoteattr(img.type)}{props}/>")
+
+        manifest.extend(self._parse_elements(manifest_items))
+        spine.extend(self._parse_elements(spine_items))
+        guide.extend(self._parse_elements(guide_items))
 
         self._write_html(root, opf_path, doctype=False)
 
 
+    @staticmethod
+    def _parse_elements(markup: list[str]) -> list[etree._Element]:
+        """Parses a list of serialized sibling elements in one call."""
+        return list(etree.fromstring(f"<root>{''.join(markup)}</root>"))
+
+
     def _create_container_xml(self):
         """Generates the META-INF/container.xml file."""
         container_path = self.paths.meta_inf / FN.CONTAINER
@@ -562,7 +619,7 @@ class EpubBuilder:
 
 
     def _create_stylesheet(self) -> None:
-        """Copies the default or custom CSS file to the Styles directory."""
+        """Adds the default or custom CSS file to the Styles directory."""
         source: Path | None = None
         destination: Path = self.paths.styles / FN.CSS
 
@@ -583,52 +640,117 @@ class EpubBuilder:
                 log.warning(f"Default stylesheet not found at {default_css}. Creating an empty stylesheet.")
 
         if source:
-            shutil.copy(source, destination)
-            # source.copy(destination)     # Python 3.14: Path.copy(dest)
+            self._write_file(destination, source.read_bytes())
         else:
             css_text = "/* Default stylesheet is missing. This empty file has been created instead. */\n"
-            destination.write_text(css_text, encoding='utf-8')
+            self._write_file(destination, css_text.encode('utf-8'))
 
 
     def _write_binaries(self):
         """Writes all image files to the images directory."""
+        # binary.data is handed to the archive as is: writestr() streams a bytes
+        # object through zf.open() without copying it, and images are stored
+        # uncompressed, so there's no intermediate buffer to save here.
         for binary in self.binaries.values():
             filepath = self.paths.images / binary.filename
-            with open(filepath, 'wb') as f:
-                f.write(binary.data)
-                log.debug(f"Saved binary: {binary.filename}")
+            self._write_file(filepath, binary.data)
+            log.debug(f"Saved binary: {binary.filename}")
 
 
     def _write_documents(self):
         """Writes XHTML etree objects to files in the Text directory."""
-        for doc in self.doc_list:
-            if doc.html is not None:
-                filepath = self.paths.text / doc.filename
-                self._write_html(doc.html, filepath)
+        docs = [doc for doc in self.doc_list if doc.html is not None]
+        if not docs:
+            return
+
+        num_threads = min(self._serialize_threads, len(docs))
+        if num_threads == 1:
+            # Not worth starting a pool for
+            for doc in docs:
+                self._write_file(self.paths.text / doc.filename, self._serialize_html(doc.html))
+                log.info(f"Created: {doc.filename}")
+            return
+
+        # Serialize in parallel, but write in order: ZipFile is not thread-safe
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            serialized = executor.map(self._serialize_html, [doc.html for doc in docs])
+            for doc, data in zip(docs, serialized):
+                self._write_file(self.paths.text / doc.filename, data)
+                log.info(f"Created: {doc.filename}")
+
+
+    def _write_package(self):
+        """Generates and writes all files of the EPUB, except mimetype."""
+        self._create_ncx()
+        self._create_opf()
+        self._create_container_xml()
+        self._create_stylesheet()
+        self._write_documents()
+        self._write_binaries()
 
 
     def _zip_epub(self):
-        """Creates the final .epub archive."""
+        """
+        Creates the final .epub archive.
+        Files are streamed straight into the archive. With config.keep_workspace
+        they are written to the temporary directory first and zipped from there,
+        and the directory is kept for inspection.
+        """
         epub_path = self.config.output_path
 
         if not epub_path:
             epub_path = self.source_path.with_suffix('.epub')
 
-        with zipfile.ZipFile(epub_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # The mimetype file must be the first and uncompressed
-            mimetype_content = 'application/epub+zip'
-            zf.writestr('mimetype', mimetype_content, compress_type=zipfile.ZIP_STORED)
+        try:
+            with zipfile.ZipFile(epub_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+                # The mimetype file must be the first and uncompressed
+                mimetype_content = 'application/epub+zip'
+                zf.writestr('mimetype', mimetype_content, compress_type=zipfile.ZIP_STORED)
+
+                if not self.config.keep_workspace:
+                    self._zip = zf
+                    self._write_package()
+                else:
+                    self._setup_workspace()
+                    self._write_package()
+
+                    # Add all other files from the temp directory.
+                    # Archive names must use forward slashes, also on Windows.
+                    root = self.paths.root
+                    for filepath in root.rglob('*'):
+                        if filepath.name == 'mimetype' or not filepath.is_file():
+                            continue
+                        arcname = filepath.relative_to(root).as_posix()
+                        zf.write(filepath, arcname, compress_type=self._compress_type(filepath.name))
+        except BaseException:
+            # Don't leave a half-written book behind
+            Path(epub_path).unlink(missing_ok=True)
+            raise
+        finally:
+            self._zip = None
+
+        log.info(f"✅ Success! EPUB file created at: {epub_path}")
 
-            # Walk through the temp directory and add all other files
-            for root, _, filenames in os.walk(self.paths.root):
-                for file in filenames:
-                    if file == 'mimetype':
-                        continue
-                    filepath = Path(root) / file
-                    arcname = filepath.relative_to(self.paths.root)
-                    zf.write(filepath, str(arcname))
 
-            log.info(f"✅ Success! EPUB file created at: {epub_path}")
+    def _write_file(self, filepath: Path, data: bytes):
+        """
+        Writes a file of the EPUB package.
+        When streaming, filepath is relative and becomes the name of the entry
+        in the archive. Otherwise it is a location inside the workspace.
+        """
+        if self._zip is not None:
+            arcname = filepath.as_posix()
+            self._zip.writestr(arcname, data, compress_type=self._compress_type(arcname))
+        else:
+            filepath.write_bytes(data)
+
+
+    @staticmethod
+    def _compress_type(filename: str) -> int:
+        """Images are stored as is, everything else is deflated."""
+        if filename.lower().endswith(STORED_EXTENSIONS):
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
 
 
     def _create_html(self, file_id: str | None, title: str = "",
@@ -638,7 +760,7 @@ class EpubBuilder:
         # Set language attributes for accessibility and correct rendering
         if self.lang:
             html.set('lang', self.lang)
-            html.set(f'{{{NS.XML}}}lang', self.lang)
+            html.set(XML_LANG, self.lang)
 
         head = etree.SubElement(html, "head")
         etree.SubElement(head, "meta", charset="UTF-8")
@@ -652,28 +774,34 @@ class EpubBuilder:
         if file_id:
             body_class = f"{file_id}-body"
             body.set('class', body_class)
-            if add_body_type and file_id in EPUB_TYPES_MAP:
-                body_type = EPUB_TYPES_MAP[file_id].epub_type
-                if body_type: body.set(f'{{{NS.EPUB}}}type', body_type)
+            structure = EPUB_TYPES_MAP.get(file_id) if add_body_type else None
+            if structure and structure.epub_type:
+                body.set(EPUB_TYPE, structure.epub_type)
         return html, body
 
 
-    @staticmethod
-    def _write_html(html: etree._Element, filepath: Path | str, doctype=True, notify=True):
-        """Writes an XHTML element tree to a file."""
-        args = {
-            'pretty_print': True,
-            'xml_declaration': True,  # not needed for HTML5, but Sigil will insert it anyway
-            'encoding': 'UTF-8',
-        }
-        if doctype:
-            args['doctype'] = '<!DOCTYPE html>'
-
-        etree.ElementTree(html).write(str(filepath), **args)
+    def _write_html(self, html: etree._Element, filepath: Path, doctype=True, notify=True):
+        """Serializes an XHTML element tree and writes it to a file in one go."""
+        self._write_file(filepath, self._serialize_html(html, doctype))
 
         if notify:
             # log filename, not full path
-            log.info(f"Created: {Path(filepath).name}")
+            log.info(f"Created: {filepath.name}")
+
+
+    @staticmethod
+    def _serialize_html(html: etree._Element, doctype=True) -> bytes:
+        """Returns an XHTML/XML element tree as UTF-8 bytes with an XML declaration."""
+        # lxml-stubs type doctype as str only, so it's left out rather than passed as None
+        extra: dict[str, Any] = {'doctype': '<!DOCTYPE html>'} if doctype else {}
+        # Always bytes with an explicit encoding
+        return cast(bytes, etree.tostring(
+            html,
+            pretty_print=True,
+            xml_declaration=True,  # not needed for HTML5, but Sigil will insert it anyway
+            encoding='UTF-8',
+            **extra,
+        ))
 
 
     def _build_id_map(self):
@@ -681,90 +809,80 @@ class EpubBuilder:
         for doc in self.doc_list:
             if doc.html is None:
                 continue
-            for element in doc.html.iterfind(".//*[@id]"):
+            # A plain walk is cheaper than evaluating an XPath predicate on each element
+            for element in doc.html.iter(etree.Element):
                 el_id = element.get('id')
                 if el_id:
                     self.id_to_doc_map[el_id] = doc.id
 
 
-    def _resolve_internal_links(self):
-        """
-        Iterates through all documents and fixes hrefs for internal links.
-        """
-        for doc in self.doc_list:
-            if doc.html is None:
-                continue
-            for a in doc.html.iterfind(".//a[@href]"):
-                href = a.get('href', '')
-                if not href.startswith('#'):
-                    log.debug("External link found, skipping.")
-                    continue
-
-                target_id = href.lstrip('#')
-                target_doc_id = self.id_to_doc_map.get(target_id)
-            
-                if target_doc_id in self.doc_map:
-                    target_doc = self.doc_map[target_doc_id]
-                    # Update the link to point to the correct file
-                    a.set('href', f"{target_doc.filename}#{target_id}")
-
-                    # If target doc is notes/comments
-                    if target_doc.is_note:
-                        cls = 'noteref'
-                        link_type = a.get('link-type')
-                        if link_type:
-                            if link_type != 'note':
-                                log.debug(f"Noteref id='{a.get('id')}', invalid link-type")
-                            a.attrib.pop('link-type')
-                        else:
-                            cls += ' comment'
-                        a.attrib.update({
-                            'class': cls,
-                            f'{{{NS.EPUB}}}type': 'noteref',
-                        })
-
-                        # PostProcessor.remove_sup_from_noteref(a)
+    def _resolve_link(self, a: etree._Element):
+        """Fixes the href of an internal link to point to the file hosting its target."""
+        href = a.get('href', '')
+        if not href.startswith('#'):
+            log.debug("External link found, skipping.")
+            return
 
+        target_id = href.lstrip('#')
+        target_doc_id = self.id_to_doc_map.get(target_id)
+
+        if target_doc_id in self.doc_map:
+            target_doc = self.doc_map[target_doc_id]
+            # Update the link to point to the correct file
+            a.set('href', target_doc.href_prefix + target_id)
+
+            # If target doc is notes/comments
+            if target_doc.is_note:
+                cls = 'noteref'
+                link_type = a.get('link-type')
+                if link_type:
+                    if link_type != 'note':
+                        log.debug(f"Noteref id='{a.get('id')}', invalid link-type")
+                    a.attrib.pop('link-type')
                 else:
-                    log.warning(f"Broken internal link found for id: {target_id}")
-                    a.set('broken', 'true')
-                    # a.tag = 'span'    # turn into <span>
-                    # del a.attrib['href']
+                    cls += ' comment'
+                a.attrib.update({
+                    'class': cls,
+                    EPUB_TYPE: 'noteref',
+                })
 
+                # PostProcessor.remove_sup_from_noteref(a)
 
-    def _insert_backlink_hrefs(self):
-        """Adds a return link to the end of each footnote."""
-        for doc in self.doc_list:
-            if not doc.is_note: continue
-            for backlink in doc.html.iterfind('.//a[@class="backlink"]'):
-                back_href = backlink.get('href')
+        else:
+            log.warning(f"Broken internal link found for id: {target_id}")
+            a.set('broken', 'true')
+            # a.tag = 'span'    # turn into <span>
+            # del a.attrib['href']
 
-                if not back_href:
-                    log.debug(f"Broken backlink: id='{backlink.get('id')}")
-                    continue
 
-                back_href = back_href.lstrip('#')
-                target_doc_id = self.id_to_doc_map.get(back_href)
-                if target_doc_id:
-                    target_doc = self.doc_map.get(target_doc_id)
-                    if target_doc:
-                        backlink.set('href', f'{target_doc.filename}#{back_href}')
+    def _resolve_backlink(self, backlink: etree._Element):
+        """Points the return link at the end of a footnote to its noteref."""
+        back_href = backlink.get('href')
 
+        if not back_href:
+            log.debug(f"Broken backlink: id='{backlink.get('id')}")
+            return
 
-    def _resolve_image_paths(self):
-        """Changes <img> placeholders to point to actual image files."""
-        for doc in self.doc_list:
-            for img in doc.html.iterfind('.//img[@data-fb2-id]'):
-                fb2_id = img.get('data-fb2-id')
-                if not fb2_id: continue
-                image_info = self.binaries.get(fb2_id)
-                if image_info:
-                    src = f"..{FN.IMAGES}/{image_info.filename}"
-                    del img.attrib['data-fb2-id']   # Clean up temporary attribute
-                else:
-                    src = "#"   # Fallback for missing images
-                    log.warning(f"Image source for ID '{fb2_id}' not found.")
-                img.set('src', src)
+        back_href = back_href.lstrip('#')
+        target_doc_id = self.id_to_doc_map.get(back_href)
+        if target_doc_id:
+            target_doc = self.doc_map.get(target_doc_id)
+            if target_doc:
+                backlink.set('href', target_doc.href_prefix + back_href)
+
+
+    def _resolve_image(self, img: etree._Element):
+        """Changes an <img> placeholder to point to the actual image file."""
+        fb2_id = img.get('data-fb2-id')
+        if not fb2_id: return
+        image_info = self.binaries.get(fb2_id)
+        if image_info:
+            src = f"..{FN.IMAGES}/{image_info.filename}"
+            del img.attrib['data-fb2-id']   # Clean up temporary attribute
+        else:
+            src = "#"   # Fallback for missing images
+            log.warning(f"Image source for ID '{fb2_id}' not found.")
+        img.set('src', src)
 
 def pretty_print_xml(element: etree._Element | etree._ElementTree) -> str:
     """Returns a pretty-printed XML string of the element/tree."""
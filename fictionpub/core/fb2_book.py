@@ -1,13 +1,19 @@
 """
 Contains the logic for parsing and representing an FB2 file.
 """
-import base64
+import binascii
+import concurrent.futures
 import logging
 import uuid
 import zipfile
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
+from typing import IO, cast
 from lxml import etree
 
+from . import _meta_cache
+from ..utils.mp import available_cpus, get_mp_context
 from ..utils.namespaces import Namespaces as NS
 from ..utils.structures import BinaryInfo
 from ..utils import xml_utils as xu
@@ -15,6 +21,57 @@ from ..utils import xml_utils as xu
 
 log = logging.getLogger("fb2_converter")
 
+FB2_DESCRIPTION = f"{{{NS.FB2}}}description"
+FB2_BODY = f"{{{NS.FB2}}}body"
+FB2_BINARY = f"{{{NS.FB2}}}binary"
+FB2_TITLE_INFO = f"{{{NS.FB2}}}title-info"
+XLINK_HREF = f"{{{NS.XLINK}}}href"
+
+# Parser options for every iterparse over FB2 input.
+# No DTD is loaded or fetched, and libxml2 doesn't build its own ID table (we build id_map).
+# huge_tree: base64 images can exceed libxml2's default text node limit.
+# Comments and PIs are dropped with their text kept in place, the converter only walks elements.
+PARSE_OPTIONS = dict(
+    load_dtd=False, no_network=True, collect_ids=False, huge_tree=True,
+    remove_comments=True, remove_pis=True,
+)
+
+# Quick metadata takes a few ms per file: below this many uncached files,
+# starting a process pool costs more than it saves
+QUICK_META_POOL_MIN = 64
+# Files per task sent to a quick metadata worker, to amortize IPC overhead
+QUICK_META_CHUNKSIZE = 32
+
+
+def _is_fb2_zip(filepath: Path) -> bool:
+    """Checks for the .fb2.zip extension, in any case."""
+    return filepath.name.lower().endswith('.fb2.zip')
+
+
+class NoFB2InZipError(FileNotFoundError):
+    """A .fb2.zip archive without a .fb2 file inside."""
+
+
+@contextmanager
+def _open_fb2_stream(filepath: Path, zf: zipfile.ZipFile | None = None) -> Iterator[IO[bytes]]:
+    """
+    Yields a binary stream of the .fb2 file, or of the first .fb2 inside a .fb2.zip.
+    An already opened zf is used instead of opening filepath again, and is left open.
+    """
+    if zf is None and not _is_fb2_zip(filepath):
+        # iterparse reads an open file faster than a filename (how much depends on the machine)
+        with open(filepath, 'rb') as fb2_file:
+            yield fb2_file
+        return
+
+    with nullcontext(zf) if zf is not None else zipfile.ZipFile(filepath, 'r') as archive:
+        fb2_info = next((i for i in archive.infolist() if i.filename.lower().endswith('.fb2')), None)
+        if fb2_info is None:
+            raise NoFB2InZipError("No .fb2 file found inside the zip archive.")
+        with archive.open(fb2_info) as fb2_file:
+            yield fb2_file
+
+
 class FB2Book:
     """
     Represents a parsed FB2 file.
@@ -23,15 +80,43 @@ class FB2Book:
     metadata, binary objects (images), and the main book content.
     It can parse both plain .fb2 and zipped .fb2.zip files.
     """
-
-    def __init__(self, filepath: Path):
-        """Initializes with the path to the FB2 file."""
+    # Compiled once, queried for every book. XPath objects are safe to share between threads.
+    # Queries on the <FictionBook> root element
+    _XP_DESCRIPTION = etree.XPath('fb:description', namespaces=NS.FB2_MAP)
+    _XP_COVER_IMAGE = etree.XPath('fb:description//fb:coverpage//fb:image', namespaces=NS.FB2_MAP)
+    _XP_TITLE_INFO = etree.XPath('fb:title-info', namespaces=NS.FB2_MAP)
+    _XP_SRC_TITLE_INFO = etree.XPath('fb:src-title-info', namespaces=NS.FB2_MAP)
+    _XP_DOCUMENT_INFO = etree.XPath('fb:document-info', namespaces=NS.FB2_MAP)
+    _XP_PUBLISH_INFO = etree.XPath('fb:publish-info', namespaces=NS.FB2_MAP)
+    _XP_AUTHOR = etree.XPath('fb:author', namespaces=NS.FB2_MAP)
+    _XP_TRANSLATOR = etree.XPath('fb:translator', namespaces=NS.FB2_MAP)
+    _XP_GENRE = etree.XPath('fb:genre', namespaces=NS.FB2_MAP)
+    _XP_SEQUENCE = etree.XPath('fb:sequence', namespaces=NS.FB2_MAP)
+    _XP_ANNOTATION = etree.XPath('fb:annotation', namespaces=NS.FB2_MAP)
+    # Attribute values are returned as strings, so libxml2 does the whole scan
+    _XP_BODIES = etree.XPath('fb:body', namespaces=NS.FB2_MAP)
+    _XP_IDS = etree.XPath('.//@id[. != ""]', smart_strings=False)
+    _XP_HREFS = etree.XPath('.//@l:href', namespaces=NS.FB2_MAP, smart_strings=False)
+
+
+    def __init__(self, filepath: Path, zf: zipfile.ZipFile | None = None):
+        """
+        Initializes with the path to the FB2 file.
+        Pass zf to read from a .fb2.zip the caller already has open.
+        """
         self.filepath = filepath
+        self._zf = zf
         self.tree: etree._ElementTree   # | None = None   # removing None to satisfy type checker
+        self.root: etree._Element
+        # (id, content-type, decoded data) of <binary> elements, taken out of the tree while parsing
+        self._raw_binaries: list[tuple[str, str, bytes]] = []
+        # Ids of binaries skipped while parsing, a body parsed later may still reference them
+        self._skipped_binary_ids: set[str] = set()
 
         # Extracted data
         self.metadata: dict[str, str | dict ] = {}
         self.binaries: dict[str, BinaryInfo] = {}
+        self._used_filenames: set[str] = set()  # filenames of self.binaries
         self.referenced_ids: set[str] = set()
         self.id_map: dict[str, str] = {}
         self.cover_img: tuple[str, int, int] | None = None
@@ -39,36 +124,36 @@ class FB2Book:
         self.note_bodies: list[etree._Element] = []
 
 
+    @staticmethod
+    def _first(xpath: etree.XPath, element: etree._Element | etree._ElementTree) -> etree._Element | None:
+        """Returns the first match of a compiled XPath, or None."""
+        return next(iter(xpath(element)), None)  # type: ignore
+
+
     def parse(self):
         """
         Parses the FB2 file and populates the instance attributes.
         This is the main entry point for this class.
         """
         self._parse_xml_tree()
-        if self.tree is None: 
-            # TODO: Throw exception, abort current thread (book)
-            return
         self._extract_metadata()
-        self._create_referenced_ids_set()
         self._extract_binaries()
         self._find_cover_image()
-        self._extract_bodies()
         self._map_internal_ids()
         log.info(f"Parsed '{self.filepath.name}' successfully.")
 
 
     @staticmethod
-    def get_quick_metadata(filepath: Path) -> tuple[str, str, str, str]:
+    def get_quick_metadata(filepath: Path, zf: zipfile.ZipFile | None = None) -> tuple[str, str, str, str]:
         """
         Quickly extracts metadata (Author, Title, Year, Lang) from an FB2 file
         without parsing the entire XML tree. Supports .fb2 and .fb2.zip.
+        Pass zf to read from a .fb2.zip the caller already has open.
+        Results are cached on disk until the file's mtime or size changes.
         
         Returns:
             tuple[str, str, str, str]: (author, title, year, lang)
         """
-        source = None
-        opened_zip = None
-
         title_info_tags = ['book-title', 'date', 'lang']
         
         # Default dict with empty values. 
@@ -81,31 +166,25 @@ class FB2Book:
             return tuple(meta.values())
 
         try:
-            # Handle ZIP files
+            st = filepath.stat()
+            cached = _meta_cache.lookup(filepath, st)
+            if cached is not None:
+                return cached
+
             # TODO: support all zips indiscriminately?
             # filepath.suffix.lower() == '.zip'
-            if str(filepath).lower().endswith('.fb2.zip'):
-                opened_zip = zipfile.ZipFile(filepath, 'r')
-                # Find first .fb2 file in zip
-                fb2_name = next((n for n in opened_zip.namelist() if n.lower().endswith('.fb2')), None)
-                if not fb2_name:
-                    meta.update({'author': "N/A", 'book-title': "No .fb2 in zip"})
-                    return meta_tuple()
-                source = opened_zip.open(fb2_name)
-            else:
-                source = str(filepath)
-
-            # Use iterparse to find the title-info block efficiently
-            tag_to_find = f"{{{NS.FB2}}}title-info"
-            context = etree.iterparse(source, events=('end',), tag=tag_to_find)
-            
-            for _, elem in context:
+            with _open_fb2_stream(filepath, zf) as source:
+                # Use iterparse to find the title-info block efficiently
+                context = etree.iterparse(source, events=('end',), tag=FB2_TITLE_INFO, **PARSE_OPTIONS)
+                elem = next((elem for _, elem in context), None)
+
+            if elem is not None:
                 # Fill in data from `title-info`
                 meta.update(xu.get_metadata_tags(elem, title_info_tags))
                 
                 authors = [
                     xu.get_person_name(author)
-                    for author in xu.elem_findall(elem, 'fb:author')
+                    for author in cast(list[etree._Element], FB2Book._XP_AUTHOR(elem))
                 ]
                 if authors:
                     meta['author'] = ", ".join(filter(None, authors))
@@ -117,39 +196,135 @@ class FB2Book:
                     # match = re.search(r'\d{4}', raw_date)
                     # year = match.group(0) if match else raw_date
 
-                # Clean up memory
-                elem.clear()
-                # Stop after the first title-info
-                break
-            
+            result = meta_tuple()
+            _meta_cache.store(filepath, st, result)
+            return result
+
+        except NoFB2InZipError:
+            meta.update({'author': "N/A", 'book-title': "No .fb2 in zip"})
             return meta_tuple()
 
         except Exception as e:
             log.warning(f"Quick metadata extraction failed for {filepath.name}: {e}")
             meta.update({'author': "*ERROR*", 'book-title': "* Failed to read metadata *"})
             return meta_tuple()
-            
-        finally:
-            if source is not None and not isinstance(source, str) and hasattr(source, 'close'):
-                source.close()
-            if opened_zip:
-                opened_zip.close()
+
+
+    @staticmethod
+    def get_quick_metadata_batch(filepaths: list[Path], workers: int = 0) -> list[tuple[str, str, str, str]]:
+        """
+        get_quick_metadata() for many files, returned in the same order.
+        Cached results are read here, the remaining files are parsed in a process pool.
+        workers=0 uses one worker per available CPU.
+        """
+        results: list[tuple[str, str, str, str] | None] = [None] * len(filepaths)
+        uncached: list[int] = []
+        for i, filepath in enumerate(filepaths):
+            try:
+                results[i] = _meta_cache.lookup(filepath, filepath.stat())
+            except OSError:
+                pass    # get_quick_metadata() reports it
+            if results[i] is None:
+                uncached.append(i)
+
+        paths = [filepaths[i] for i in uncached]
+        if len(paths) < QUICK_META_POOL_MIN:
+            metas = list(map(FB2Book.get_quick_metadata, paths))
+        else:
+            # No more workers than there are chunks to hand out
+            num_chunks = -(-len(paths) // QUICK_META_CHUNKSIZE)
+            max_workers = min(workers or available_cpus(), num_chunks)
+            with concurrent.futures.ProcessPoolExecutor(max_workers, mp_context=get_mp_context([__name__])) as executor:
+                metas = list(executor.map(FB2Book.get_quick_metadata, paths, chunksize=QUICK_META_CHUNKSIZE))
+
+        for i, meta in zip(uncached, metas):
+            results[i] = meta
+        return results     # type: ignore[return-value]
     
 
     def _parse_xml_tree(self):
-        """Loads the XML file into an lxml tree, handling .fb2 and .fb2.zip files."""
-        if str(self.filepath).endswith('.fb2.zip'):
-            with zipfile.ZipFile(self.filepath, 'r') as zf:
-                # Find the .fb2 file inside the archive
-                fb2_files = [name for name in zf.namelist() if name.endswith('.fb2')]
-                if not fb2_files:
-                    raise FileNotFoundError("No .fb2 file found inside the zip archive.")
-                
-                # Open the first .fb2 file found as a stream and parse it
-                with zf.open(fb2_files[0]) as fb2_file:
-                    self.tree = etree.parse(fb2_file)
-        else:
-            self.tree = etree.parse(str(self.filepath))
+        """
+        Parses the FB2 file in a single streaming pass.
+        <description> and <body> elements stay in the tree, <binary> elements
+        are decoded and removed as soon as each one is parsed.
+        """
+        # Links to images come from the description (cover) and bodies,
+        # which usually precede binaries in FB2
+        handlers = {
+            FB2_DESCRIPTION: self._add_referenced_ids,
+            FB2_BODY: self._add_body,
+            FB2_BINARY: self._add_binary,
+        }
+        with _open_fb2_stream(self.filepath, self._zf) as source:
+            context = etree.iterparse(source, events=('end',), tag=tuple(handlers), **PARSE_OPTIONS)
+            for _, el in context:
+                handlers[el.tag](el)
+
+            self.root = context.root
+            self.tree = self.root.getroottree()
+
+        # Binaries that were skipped, but are referenced from a body that comes after them
+        late_ids = self._skipped_binary_ids & self.referenced_ids
+        if late_ids:
+            self._reread_binaries(late_ids)
+        self._skipped_binary_ids.clear()
+
+
+    def _reread_binaries(self, binary_ids: set[str]):
+        """Decodes the given binaries in a second pass over the file, only reading <binary> elements."""
+        log.debug(f"Re-reading {len(binary_ids)} binaries referenced after their position.")
+        with _open_fb2_stream(self.filepath, self._zf) as source:
+            for _, el in etree.iterparse(source, events=('end',), tag=FB2_BINARY, **PARSE_OPTIONS):
+                binary_id = el.get('id')
+                if binary_id in binary_ids:
+                    self._store_binary(binary_id, el.get('content-type'), el.text)
+                el.clear()
+
+
+    def _add_referenced_ids(self, root: etree._Element):
+        """Adds the targets of all `href` links inside root to referenced_ids."""
+        self.referenced_ids.update(href.lstrip('#') for href in cast(list[str], self._XP_HREFS(root)) if href)
+
+
+    def _add_binary(self, binary: etree._Element):
+        """
+        Decodes the content of a <binary>, unless it's never referenced.
+        Decoding right away lets the base64 text of each binary be freed
+        before the next one is parsed.
+        """
+        binary_id = binary.get('id')
+        content_type = binary.get('content-type')
+        # Without any bodies parsed yet, it's too early to tell whether the binary is used.
+        # _extract_binaries() skips the unreferenced ones later.
+        # Skipped ones are re-read if a later body references them.
+        used = binary_id in self.referenced_ids or not (self.main_bodies or self.note_bodies)
+        # Unused ones are skipped without reading the base64 text into Python
+        text = binary.text if used else None
+        # Drop the element with its base64 text from the tree, nothing reads it after this
+        binary.clear()
+        parent = binary.getparent()
+        if parent is not None:
+            parent.remove(binary)
+        if not used:
+            if binary_id:
+                self._skipped_binary_ids.add(binary_id)
+            return
+        self._store_binary(binary_id, content_type, text)
+
+
+    def _store_binary(self, binary_id: str | None, content_type: str | None, text: str | None):
+        """Decodes the base64 text of a binary and keeps it for _extract_binaries()."""
+        if not (binary_id and text and content_type):
+            log.warning(f"Invalid binary {binary_id} {content_type}. Skipping.")
+            return
+
+        try:
+            # Skips ignored characters (line breaks) itself, no need to strip them first
+            data = binascii.a2b_base64(text)
+        except (ValueError, TypeError) as e:
+            log.warning(f"Could not decode binary with id '{binary_id}'. Error: {e}")
+            return
+        self._raw_binaries.append((binary_id, content_type, data))
 
 
     def _extract_metadata(self):
@@ -161,7 +336,7 @@ class FB2Book:
         generated_id = str(uuid.uuid4())
         default_lang = "uk"
 
-        desc = xu.elem_find(self.tree, './/fb:description')
+        desc = self._first(self._XP_DESCRIPTION, self.root)
         if desc is None:
             # Set defaults and return
             self.metadata = {'title': 'Untitled', 
@@ -171,7 +346,7 @@ class FB2Book:
             return
 
         # --- Title Info ---
-        title_info = xu.elem_find(desc, 'fb:title-info')
+        title_info = self._first(self._XP_TITLE_INFO, desc)
         if title_info is not None:
             title_info_tags = ['book-title', 'keywords', 'date', 'lang']
             meta.update(xu.get_metadata_tags(title_info, title_info_tags))
@@ -179,20 +354,20 @@ class FB2Book:
                 # 'author': xu.get_person_name(xu.element_find(title_info, 'fb:author')),
                 'authors': [
                     xu.get_person_name(author)
-                    for author in xu.elem_findall(title_info, 'fb:author')],
+                    for author in self._XP_AUTHOR(title_info)],
                 'translators': [
                     xu.get_person_name(t)
-                    for t in xu.elem_findall(title_info, 'fb:translator')
+                    for t in self._XP_TRANSLATOR(title_info)
                 ],
             })
 
-            self.annotation_el = xu.elem_find(title_info, 'fb:annotation')
+            self.annotation_el = self._first(self._XP_ANNOTATION, title_info)
 
             # Add genres to the set
-            genres.update(g.text for g in xu.elem_findall(title_info, 'fb:genre'))
+            genres.update(g.text for g in self._XP_GENRE(title_info))
 
             # Series, series number
-            seq = xu.elem_find(title_info, 'fb:sequence')
+            seq = self._first(self._XP_SEQUENCE, title_info)
             if seq is not None:
                 meta['sequence'] = seq.get('name')                    
                 seq_num = seq.get('number') 
@@ -208,28 +383,28 @@ class FB2Book:
         # meta['lang'] = meta.get('lang', default_lang)
 
         # --- Source Title Info ---
-        src_title_info = xu.elem_find(desc, 'fb:src-title-info')
+        src_title_info = self._first(self._XP_SRC_TITLE_INFO, desc)
         if src_title_info is not None:
             src_title_info_tags = ['book-title', 'date', 'src-lang']
             meta['src'] = xu.get_metadata_tags(src_title_info, src_title_info_tags) 
-            meta['src']['author'] = xu.get_person_name(xu.elem_find(src_title_info, 'fb:author'))
+            meta['src']['author'] = xu.get_person_name(self._first(self._XP_AUTHOR, src_title_info))
                 
             # Add genres to the set
-            genres.update(g.text for g in xu.elem_findall(src_title_info, 'fb:genre'))
+            genres.update(g.text for g in self._XP_GENRE(src_title_info))
 
         # --- Document Info ---
-        doc_info = xu.elem_find(desc, 'fb:document-info')
+        doc_info = self._first(self._XP_DOCUMENT_INFO, desc)
         if doc_info is not None:
             doc_info_tags = ['program-used', 'date', 'id', 'version']
             meta['doc'] = xu.get_metadata_tags(doc_info, doc_info_tags)                   
-            meta['doc']['author'] = xu.get_person_name(xu.elem_find(doc_info, 'fb:author'))
+            meta['doc']['author'] = xu.get_person_name(self._first(self._XP_AUTHOR, doc_info))
 
         # Ensure id, date are set
         meta['id'] = meta.get('doc', {}).get('id', generated_id)
         meta['date'] = meta.get('doc', {}).get('date', '')
 
         # --- Publish Info ---
-        pub_info = xu.elem_find(desc, 'fb:publish-info')
+        pub_info = self._first(self._XP_PUBLISH_INFO, desc)
         if pub_info is not None:
             pub_info_tags = ['book-name', 'publisher', 'city', 'year', 'isbn']
             meta['pub'] = xu.get_metadata_tags(pub_info, pub_info_tags)
@@ -243,31 +418,21 @@ class FB2Book:
 
 
     def _extract_binaries(self):
-        """Finds all <binary> tags, decodes and stores them."""
-
-        # Find and decode all binary objects
-        for binary in xu.elem_findall(self.tree, './/fb:binary'):
-            binary_id = binary.get('id')
-            
+        """Names and stores the binaries decoded while parsing."""
+        for binary_id, content_type, data in self._raw_binaries:
             # Skip binaries that are never referenced
             # TODO: Better be moved to builder / post-convert cleanup
             if binary_id not in self.referenced_ids:
                 continue
-            
-            content_type = binary.get('content-type')
-            if not (binary_id and binary.text and content_type):
-                log.warning(f"Invalid binary {binary_id} {content_type}. Skipping.")
-                continue
-            
+
             ext = content_type.split('/')[-1]
             if ext == 'jpeg': ext = 'jpg'
             filename = self._normalize_binary_name(binary_id, ext)
 
-            try:
-                # {binary_id}" was used in FB2, {filename} will be used in EPUB
-                self.binaries[binary_id] = BinaryInfo(filename, content_type, base64.b64decode(binary.text))
-            except (ValueError, TypeError) as e:
-                log.warning(f"Could not decode binary with id '{binary_id}'. Error: {e}")
+            # {binary_id}" was used in FB2, {filename} will be used in EPUB
+            self.binaries[binary_id] = BinaryInfo(filename, content_type, data)
+
+        self._raw_binaries.clear()
             
 
     def _normalize_binary_name(self, id: str, ext: str) -> str:
@@ -277,21 +442,22 @@ class FB2Book:
             base_name = f"{id}.{ext}"
         
         filename = base_name
-        existing_filenames: set[str] = {b.filename for b in self.binaries.values()}
         counter = 1
 
-        while filename in existing_filenames:
+        while filename in self._used_filenames:
             # Append a counter to avoid name collisions
             filename = f"{base_name}_{counter}.{ext}"
             counter += 1
+        self._used_filenames.add(filename)
         return filename
 
 
     def _find_cover_image(self):
         """Finds the cover image and its dimensions."""
-        cover_el = xu.elem_find(self.tree.getroot(), './/fb:coverpage//fb:image')
+        # Only the description is searched, a book without a cover doesn't scan its bodies
+        cover_el = self._first(self._XP_COVER_IMAGE, self.root)
         if cover_el is not None:
-            cover_id = cover_el.get(f"{{{NS.XLINK}}}href", "").lstrip('#')
+            cover_id = cover_el.get(XLINK_HREF, "").lstrip('#')
             if cover_id not in self.binaries:
                 return
 
@@ -299,32 +465,43 @@ class FB2Book:
             self.binaries[cover_id].prop = "cover-image"
 
 
-    def _extract_bodies(self):
-        """Gets the main <body> and notes/comments <body> elements."""       
-        root = self.tree.getroot()  
-        for body in root.iterfind('fb:body', NS.FB2_MAP):
-            bname = body.get('name')
-            if bname in ['notes', 'comments', 'footnotes']:
-                self.note_bodies.append(body)
-            else:
-                self.main_bodies.append(body)
-                if bname:
-                    log.info(f"\tTreating body[name={bname}] as main content.")
+    def _add_body(self, body: etree._Element):
+        """Sorts a parsed <body> into main or notes/comments bodies."""
+        self._add_referenced_ids(body)
+        bname = body.get('name')
+        if bname in ['notes', 'comments', 'footnotes']:
+            self.note_bodies.append(body)
+        else:
+            self.main_bodies.append(body)
+            if bname:
+                log.info(f"\tTreating body[name={bname}] as main content.")
+
+
+    def iter_main_bodies(self) -> Iterator[etree._Element]:
+        """Yields main bodies one by one, freeing each once the caller moves on to the next."""
+        return self._drain_bodies(self.main_bodies)
+
+
+    def iter_note_bodies(self) -> Iterator[etree._Element]:
+        """Yields notes/comments bodies one by one, freeing each once the caller moves on to the next."""
+        return self._drain_bodies(self.note_bodies)
+
+
+    @staticmethod
+    def _drain_bodies(bodies: list[etree._Element]) -> Iterator[etree._Element]:
+        """Empties the list, yielding each body and then dropping it from the tree."""
+        while bodies:
+            body = bodies.pop(0)
+            yield body
+            # The converter builds new XHTML elements, nothing points back into the FB2 body
+            body.clear()
+            parent = body.getparent()
+            if parent is not None:
+                parent.remove(body)
 
 
     def _map_internal_ids(self):
         """Creates a map of all `id` attributes for internal linking."""
         # TODO: make it actually useful
-        for body in self.tree.iterfind('.//body'):
-            for element in body.iterfind('.//*[@id]'):
-                element_id = element.get('id')
-                if element_id:
-                    self.id_map[element_id] = body.get('name', 'main')
-
-
-    def _create_referenced_ids_set(self):
-        """Creates a set of all `href` links."""
-        for element in self.tree.iterfind('.//*[@l:href]', namespaces=NS.FB2_MAP):
-            id = element.get(f'{{{NS.XLINK}}}href')
-            if id:
-                self.referenced_ids.add(id.lstrip('#'))
+        for body in self._XP_BODIES(self.root):
+            self.id_map.update(dict.fromkeys(self._XP_IDS(body), body.get('name', 'main')))
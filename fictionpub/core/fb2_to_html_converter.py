@@ -2,7 +2,6 @@
 Handles the conversion of FB2 XML elements to XHTML.
 """
 import logging
-from typing import NamedTuple
 
 from lxml import etree
 
@@ -15,15 +14,16 @@ from ..utils.structures import BinaryInfo, ConvertedBody, FNames as FN
 
 log = logging.getLogger("fb2_converter")
 
-
-class Tag(NamedTuple):
-    """Structure to represent an XHTML tag with attributes."""
-    name: str
-    attrib: dict | None = None
-
-    def create(self) -> etree._Element:
-        """Creates an lxml Element with the specified tag and attributes."""
-        return etree.Element(self.name, self.attrib)
+# Clark notation names, formatted once
+FB2_SECTION = f"{{{NS.FB2}}}section"
+FB2_TITLE = f"{{{NS.FB2}}}title"
+FB2_LINK = f"{{{NS.FB2}}}a"
+FB2_IMAGE = f"{{{NS.FB2}}}image"
+FB2_STYLE = f"{{{NS.FB2}}}style"
+XLINK_HREF = f"{{{NS.XLINK}}}href"
+EPUB_TYPE = f"{{{NS.EPUB}}}type"
+# Indexed by heading level - 1
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
 
 
 class FB2ToHTMLConverter:
@@ -31,8 +31,8 @@ class FB2ToHTMLConverter:
     Transforms lxml Elements from the FB2 namespace to the XHTML namespace.
 
     This class uses a handler-based approach, dispatching element conversion
-    to specific methods based on the FB2 tag name. This avoids large if-elif
-    blocks and makes the converter easily extensible.
+    to specific methods based on the FB2 tag name. Tags without a dedicated
+    handler are converted by `_handle_default` using the tag map.
     """
 
     def __init__(self, binary_map: dict, id_map: dict, config: ConversionConfig):
@@ -47,40 +47,31 @@ class FB2ToHTMLConverter:
         self.config = config
 
         # Map for direct tag-to-tag conversions. 
-        # FB2 tags are mapped to strings of 'tag' or tuples of (tag, attributes)
-        self.tag_map: dict[str, Tag] = {
-            'body': Tag('body'),
-            'p': Tag('p'),
-            'subtitle': Tag('p', {'class': 'subtitle'}),
-            'text-author': Tag('p', {'class': 'text-author'}),
-            'strong': Tag('strong'), 'b': Tag('strong'),
-            'em': Tag('em'), 'emphasis': Tag('em'), 'i': Tag('em'),
-            'strikethrough': Tag('s'), 's': Tag('s'),
-            'cite': Tag('blockquote', {'class': 'q'}),
-            'v': Tag('p', {'class': 'v'}),
-            'table': Tag('table'),
-            'tr': Tag('tr'),
-            'th': Tag('th'),
-            'td': Tag('td'),
-            'sup': Tag('sup'),
-            'sub': Tag('sub'),
-            'code': Tag('code'), #HTMLTag('span', {'class': 'code'}),
-            'ol': Tag('ol'),
-            'ul': Tag('ul'),
-            'li': Tag('li'),
-            'empty-line': Tag('empty-line')  # cleaned up in post-processing
+        # FB2 tags are mapped to (tag, attributes) tuples
+        self.tag_map: dict[str, tuple[str, dict | None]] = {
+            'body': ('body', None),
+            'p': ('p', None),
+            'subtitle': ('p', {'class': 'subtitle'}),
+            'text-author': ('p', {'class': 'text-author'}),
+            'strong': ('strong', None), 'b': ('strong', None),
+            'em': ('em', None), 'emphasis': ('em', None), 'i': ('em', None),
+            'strikethrough': ('s', None), 's': ('s', None),
+            'cite': ('blockquote', {'class': 'q'}),
+            'v': ('p', {'class': 'v'}),
+            'table': ('table', None),
+            'tr': ('tr', None),
+            'th': ('th', None),
+            'td': ('td', None),
+            'sup': ('sup', None),
+            'sub': ('sub', None),
+            'code': ('code', None), #HTML('span', {'class': 'code'}),
+            'ol': ('ol', None),
+            'ul': ('ul', None),
+            'li': ('li', None),
+            'empty-line': ('empty-line', None)  # cleaned up in post-processing
             # annotation, epigraph, poem, stanza -> div class=tag
         }
 
-        # Dispatch map for tags that require special handling.
-        self._handler_map = {
-            'section': self._handle_section,
-            'title': self._handle_title,
-            'a': self._handle_link,
-            'image': self._handle_image,
-            'style': self._handle_style,
-        }
-
 
     def convert_body(self, fb2_body: etree._Element, mode: ConversionMode) -> list[ConvertedBody]:
         """
@@ -97,7 +88,8 @@ class FB2ToHTMLConverter:
         
         # Convert while splitting
         for child in fb2_body:
-            self._recursive_convert(child, self._current_body)
+            # Children of a body have no <section> ancestors
+            self._recursive_convert(child, self._current_body, section_depth=0)
 
         # Post-process all converted bodies
         for body_obj in self._converted_bodies:
@@ -129,8 +121,9 @@ class FB2ToHTMLConverter:
         level_index = level - 1
         if level_index < 0: level_index = 0
         self._level_counters[level_index] += 1
-        for i in range(level_index + 1, len(self._level_counters)):
-            self._level_counters[i] = 0
+        # Reset deeper levels, keeping the list length
+        deeper = len(self._level_counters) - level_index - 1
+        self._level_counters[level_index + 1:] = [0] * deeper
         name_parts = [str(c) for c in self._level_counters[:level] if c > 0]
         if not name_parts: name_parts = [str(self._level_counters[0])]
         
@@ -153,91 +146,136 @@ class FB2ToHTMLConverter:
         self._converted_bodies.append(body_data)
 
 
-    def _recursive_convert(self, fb2_element: etree._Element, xhtml_parent: etree._Element):
-        """Core recursive engine for converting FB2 elements to XHTML."""
-        tag = xu.get_tag_name(fb2_element)
-
-        # --- Isolate Splitting Logic ---
-        # Check for the special split case before calling any handler.
-        if tag == 'section' and self.mode == ConversionMode.MAIN:
-            level = self._get_heading_level(fb2_element)
-            if level == self.split_level:
-                self._start_new_body(fb2_element, level)
-                # This section's children get appended directly to the new body.
-                # The <section> tag itself is discarded.
-                for child in fb2_element:
-                    self._recursive_convert(child, self._current_body)
-                return
-
-        # --- Standard Recursive Flow ---
-        handler = self._handler_map.get(tag, self._handle_default)
-        new_xhtml_element = handler(fb2_element)
-
-        if new_xhtml_element is None: return
-    
-        new_xhtml_element.text = fb2_element.text
-        xhtml_parent.append(new_xhtml_element)
-
-        for child in fb2_element:
-            # Recursion continues inside the newly created element.
-            self._recursive_convert(child, new_xhtml_element)
-            if child.tail:
-                if len(new_xhtml_element) > 0:
-                    last_child = new_xhtml_element[-1]
-                    last_child.tail = (last_child.tail or '') + child.tail
+    def _recursive_convert(
+        self, fb2_element: etree._Element, xhtml_parent: etree._Element, section_depth: int | None = None
+    ):
+        """
+        Core engine for converting FB2 elements to XHTML.
+        Walks the subtree with iterwalk instead of recursing per element.
+        Pass section_depth if the number of `<section>` ancestors of fb2_element is known.
+        """
+        # Number of <section> ancestors of the current element, tracked during the walk
+        depth = self._get_section_depth(fb2_element) if section_depth is None else section_depth
+        # XHTML parent for the children of each open element, the last one is the current parent.
+        # None marks a split section: its children go to the body that is current
+        # when each one is converted, and their tails are dropped.
+        parents: list[etree._Element | None] = [xhtml_parent]
+
+        walker = etree.iterwalk(fb2_element, events=('start', 'end'))
+        for event, element in walker:
+            # Compared in Clark notation, the local name is only needed by _handle_default
+            tag = element.tag
+
+            if event == 'end':
+                parents.pop()
+                if tag == FB2_SECTION:
+                    depth -= 1
+                # The tail of the converted subtree itself is left to the caller
+                tail = element.tail
+                if not tail or element is fb2_element:
+                    continue
+                parent = parents[-1]
+                if parent is None:
+                    continue
+                # Usually the target has no text yet (the tail follows the element
+                # just converted from this one), so it is assigned without concatenating
+                if len(parent) > 0:
+                    last_child = parent[-1]
+                    last_child.tail = last_child.tail + tail if last_child.tail else tail
                 else:
-                    new_xhtml_element.text = (new_xhtml_element.text or '') + child.tail
+                    parent.text = parent.text + tail if parent.text else tail
+                continue
+
+            parent = parents[-1]
+            if parent is None:
+                parent = self._current_body
+
+            # --- Isolate Splitting Logic ---
+            # Check for the special split case before calling any handler.
+            if tag == FB2_SECTION and self.mode == ConversionMode.MAIN:
+                level = self._get_heading_level(depth)
+                if level == self.split_level:
+                    self._start_new_body(element, level)
+                    # This section's children get appended directly to the new body.
+                    # The <section> tag itself is discarded.
+                    parents.append(None)
+                    depth += 1
+                    continue
+
+            # --- Standard Flow ---
+            # Read by the handlers instead of counting ancestors
+            self._section_depth = depth
+            # Tags that require special handling. Branching directly is cheaper than
+            # a dict lookup, and most elements fall through to the default handler.
+            # Handlers create the new element inside parent, or return None to skip the subtree.
+            if tag == FB2_SECTION:
+                new_xhtml_element = self._handle_section(element, parent)
+                # Children of a section are one level deeper
+                depth += 1
+            elif tag == FB2_TITLE:
+                new_xhtml_element = self._handle_title(element, parent)
+            elif tag == FB2_LINK:
+                new_xhtml_element = self._handle_link(element, parent)
+            elif tag == FB2_IMAGE:
+                new_xhtml_element = self._handle_image(element, parent)
+            elif tag == FB2_STYLE:
+                new_xhtml_element = self._handle_style(element, parent)
+            else:
+                new_xhtml_element = self._handle_default(element, parent)
+
+            if new_xhtml_element is None:
+                # Still has an 'end' event, which pops this entry
+                walker.skip_subtree()
+                parents.append(parent)
+                continue
+
+            new_xhtml_element.text = element.text
+            # Conversion continues inside the newly created element
+            parents.append(new_xhtml_element)
 
     # --- SECTION AND TITLE HANDLERS ---
 
-    def _handle_section(self, element: etree._Element) -> etree._Element | None:
+    def _handle_section(self, element: etree._Element, xhtml_parent: etree._Element) -> etree._Element | None:
         element_id = element.get('id')
-        # TODO: consider splitting this method
-        """if mode == ConversionMode.NOTE and element_id:
-            return self._handle_note_section(element)
-        else: # no ID ConversionMode.MAIN
-            return self._handle_main_section(element)
-        """
+        # TODO: consider splitting this method into _handle_note_section/_handle_main_section
         # sections with id are footnote wrappers in notes mode
         # TODO: improve wrapper detection (must have title, referenced by link)
         if self.mode == ConversionMode.NOTE and element_id:
             attrib = {
                 'class': 'footnote',
                 'id': element_id,
-                f'{{{NS.EPUB}}}type': 'footnote',
+                EPUB_TYPE: 'footnote',
                 'role': 'doc-footnote',
             }
-            aside = etree.Element('aside', attrib)
+            aside = etree.SubElement(xhtml_parent, 'aside', attrib)
 
-            title_el = element.find(f'{{{NS.FB2}}}title')
+            title_el = element.find(FB2_TITLE)
             if title_el is not None:
                 title_text = " ".join(title_el.itertext()).strip()  # type: ignore
                 attrib = {
                     'href': f'#{element_id}-ref',   # point to the note reference
                     'class': 'backlink',
                     'id': f'{element_id}-back',
-                    f'{{{NS.EPUB}}}type': 'backlink',
+                    EPUB_TYPE: 'backlink',
                 }
-                backlink = etree.Element('a', attrib)
+                # The 1st child of the new aside, will be adjusted in post-processing
+                backlink = etree.SubElement(aside, 'a', attrib)
                 backlink.text = f"{title_text}.\u00A0"  # dot + NBSP
-                # insert as the 1st child, will be adjusted in post-processing
-                aside.insert(0, backlink) 
                 element.remove(title_el)
             return aside
         
         # Default section handling
         if self.mode == ConversionMode.NOTE:
-            tag = Tag('div', {'class': 'note-section'})
+            section = etree.SubElement(xhtml_parent, 'div', {'class': 'note-section'})
         else:
             # ConversionMode.MAIN or ELEMENT
             # TODO: unwrap sections
-            tag = Tag('section')
-        section = etree.Element(tag.name, tag.attrib)
+            section = etree.SubElement(xhtml_parent, 'section')
         xu.copy_id(element, section)
         return section
     
 
-    def _handle_title(self, element: etree._Element) -> etree._Element | None:
+    def _handle_title(self, element: etree._Element, xhtml_parent: etree._Element) -> etree._Element | None:
         """
         Converts `title` tag to h1..h6 based on nesting level.
         """
@@ -248,37 +286,38 @@ class FB2ToHTMLConverter:
 
         # <poem> title => p.subtitle
         if xu.get_tag_name(parent) == "poem":
-            return self._handle_default(element, convert_as='subtitle')
+            return self._handle_default(element, xhtml_parent, convert_as='subtitle')
             
-        level = self._get_heading_level(element)
+        depth = self._section_depth
+        level = self._get_heading_level(depth)
         if self.mode == ConversionMode.NOTE: level = 1
-        h = f'h{level}'
-        title_text = " ".join(element.itertext()).strip() # type: ignore
+        h = HEADING_TAGS[level - 1]
 
-        parent_level = self._get_heading_level(parent)
+        parent_depth = depth - 1 if parent.tag == FB2_SECTION else depth
+        parent_level = self._get_heading_level(parent_depth)
         # TODO: investigate usage of _current_title
         if parent_level == self.split_level - 1:
+            # Only titles of split documents need their text
+            title_text = " ".join(element.itertext()).strip() # type: ignore
             self._current_title = title_text
             if self._converted_bodies:
-                last_doc = self._converted_bodies[-1]
-                self._converted_bodies[-1] = last_doc._replace(title=title_text)
+                self._converted_bodies[-1].title = title_text
 
-        new_element = etree.Element(h)
+        new_element = etree.SubElement(xhtml_parent, h)
         xu.copy_id(element, new_element)
         return new_element
     
 
-    def _handle_image(self, element: etree._Element) -> etree._Element | None:
+    def _handle_image(self, element: etree._Element, xhtml_parent: etree._Element) -> etree._Element | None:
         """
         Converts `image` tag to `figure`.
         Saves dimensions as attributes.
         """
         # TODO: handle p>img as inline?, section>img as fullscreen?
-        img_id = element.get(f'{{{NS.XLINK}}}href', '').lstrip('#')
-        if not img_id or img_id not in self.binary_map:
+        img_id = element.get(XLINK_HREF, '').lstrip('#')
+        binary = self.binary_map.get(img_id) if img_id else None
+        if binary is None:
             return None
-        
-        binary = self.binary_map[img_id]
 
         fig_attrib = {'class': 'image'}
         img_attrib = {'src': f'../{FN.IMAGES}/{binary.filename}'}
@@ -293,28 +332,26 @@ class FB2ToHTMLConverter:
             
             fig_attrib['class'] += f" {binary.orientation}".strip()
         
-        figure = etree.Element('figure', fig_attrib)
+        figure = etree.SubElement(xhtml_parent, 'figure', fig_attrib)
         img = etree.SubElement(figure, 'img', img_attrib)
         xu.copy_id(element, img)
         return figure
 
     
-    def _handle_link(self, element: etree._Element) -> etree._Element | None:
+    def _handle_link(self, element: etree._Element, xhtml_parent: etree._Element) -> etree._Element | None:
         """Creates `a` and copies over href."""
-        href = element.get(f'{{{NS.XLINK}}}href')
-        attrib = {}
-        
+        href = element.get(XLINK_HREF)
+
         if href:
             is_external = not href.startswith("#")
-            # Save prefix and clear it from href
-            prefix = "" if is_external else "#"
+            # Clear the prefix from href, internal links get a single '#'
             href = href.lstrip("#")
 
             a_id = element.get('id')
             if (a_id):
                 log.warning(f"Overwriting existing <a> id: {a_id}")
             attrib = {
-                'href': f'{prefix}{href}',
+                'href': href if is_external else f'#{href}',
                 'id': f'{href}-ref'
             }
             # TODO: remove? link-type isn't very useful. 
@@ -324,28 +361,30 @@ class FB2ToHTMLConverter:
                 attrib['link-type'] = link_type
 
         else:
-            attrib={'class': 'empty'}
-        
-        link = etree.Element('a', attrib)
-        return link
+            attrib = {'class': 'empty'}
+
+        return etree.SubElement(xhtml_parent, 'a', attrib)
 
 
-    def _handle_style(self, element: etree._Element) -> etree._Element | None:
+    def _handle_style(self, element: etree._Element, xhtml_parent: etree._Element) -> etree._Element | None:
         """Converts `style` tag to `span` with class=name."""
         name = element.get('name')
         if not name:
             return None
-        span = etree.Element('span', attrib={'class': name})
+        span = etree.SubElement(xhtml_parent, 'span', attrib={'class': name})
         return span
 
 
-    def _handle_default(self, element: etree._Element, convert_as: str | None = None) -> etree._Element | None:
+    def _handle_default(
+        self, element: etree._Element, xhtml_parent: etree._Element, convert_as: str | None = None
+    ) -> etree._Element | None:
         """
         Handles simple tag conversions using the `tag_map`.
         Defaults to `div class="tag"` for the rest of cases.
         
         Args:
             element: The FB2 element to convert.
+            xhtml_parent: The XHTML element the result is appended to.
             convert_as: Optional FB2 tag name to override the default mapping.
         """        
         fb2_tag = convert_as or xu.get_tag_name(element)
@@ -358,19 +397,25 @@ class FB2ToHTMLConverter:
             html_attrib = {'class': fb2_tag}
         
         # Merge attributes with existing ones (typically only 'id', 'name')
-        attrib = xu.get_attrib_dict(element) 
-        attrib.update(html_attrib or {})
+        attrib = xu.get_attrib_dict(element)
+        if html_attrib:
+            attrib.update(html_attrib)
 
-        elem = etree.Element(html_tag, attrib)
+        elem = etree.SubElement(xhtml_parent, html_tag, attrib)
         return elem
     
 
-    def _get_heading_level(self, element: etree._Element) -> int:
-        """Determines heading level by counting the number of `<section>` ancestors. """
+    @staticmethod
+    def _get_section_depth(element: etree._Element) -> int:
+        """Counts the `<section>` ancestors of an element."""
         # The tag must be in the Clark notation {namespace}tag
-        section_tag = f"{{{NS.FB2}}}section"
-        depth = sum(1 for _ in element.iterancestors(section_tag))
-        return min(depth, 6) or 1   # Min depth is 1, max is 6     
+        return sum(1 for _ in element.iterancestors(FB2_SECTION))
+
+
+    @staticmethod
+    def _get_heading_level(depth: int) -> int:
+        """Determines heading level from the number of `<section>` ancestors."""
+        return min(depth, 6) or 1   # Min depth is 1, max is 6
 
 
     # --- END of ElementConverter ---
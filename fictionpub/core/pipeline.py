@@ -18,6 +18,7 @@ class ConversionPipeline:
 
     The UI layer (CLI or GUI) interacts with this class to run a conversion.
     It coordinates the activities of the parser, converter, and builder.
+    Holds no per-file state, so one instance can convert any number of files.
     """
 
     def __init__(self, config: ConversionConfig):
@@ -45,13 +46,14 @@ class ConversionPipeline:
         builder.set_binaries(fb2_book.binaries)
         builder.set_metadata(fb2_book.metadata)
 
-        # 4. Convert the FB2 bodies to XHTML documents
+        # 4. Convert the FB2 bodies to XHTML documents.
+        # Each FB2 body is freed once converted, so the source and XHTML trees don't peak together.
         main_doc_fragments = []
-        for body in fb2_book.main_bodies:
+        for body in fb2_book.iter_main_bodies():
             main_doc_fragments.extend(converter.convert_body(body, ConversionMode.MAIN))
 
         note_doc_fragments = []
-        for body in fb2_book.note_bodies:
+        for body in fb2_book.iter_note_bodies():
             note_doc_fragments.extend(converter.convert_body(body, ConversionMode.NOTE))
 
         if fb2_book.annotation_el is not None:
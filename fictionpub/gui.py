@@ -418,7 +418,7 @@ class ConverterApp:
 
     def _batch_add_files(self, files: list[Path]):
         """Adds files to treeview and queues metadata parsing. Runs on main thread."""
-        added_count = 0
+        added: list[tuple[str, Path]] = []
         for path in files:
             s_path = str(path)
             if s_path in self.file_map: 
@@ -434,20 +434,24 @@ class ConverterApp:
             p_node = self.folder_nodes[s_parent]
             item_id = self.tree.insert(p_node, tk.END, text=path.name, image=self.icon_selected, values=("Parsing...", "", "", ""))
             self.file_map[s_path] = item_id
-            added_count += 1
-            
-            # Submit to ThreadPool instead of creating a new thread
-            self.meta_executor.submit(self._parse_meta_task, item_id, path)
-            
-        self.status_label.config(text=f"Added {added_count} new files.")
+            added.append((item_id, path))
+
+        if added:
+            # One task for the whole batch: it reads the cache and parses the rest in a process pool
+            self.meta_executor.submit(self._parse_meta_task, added)
+
+        self.status_label.config(text=f"Added {len(added)} new files.")
 
-    def _parse_meta_task(self, item_id, path):
+    def _parse_meta_task(self, items: list[tuple[str, Path]]):
         """Task running in thread pool."""
         try:
-            meta = FB2Book.get_quick_metadata(path)
-            self.queue.put(("parse_ok", item_id, meta))
+            metas = FB2Book.get_quick_metadata_batch([path for _, path in items])
         except Exception as e:
-            self.queue.put(("parse_fail", item_id, str(e)))
+            for item_id, _ in items:
+                self.queue.put(("parse_fail", item_id, str(e)))
+            return
+        for (item_id, _), meta in zip(items, metas):
+            self.queue.put(("parse_ok", item_id, meta))
 
     # --- Conversion ---
 
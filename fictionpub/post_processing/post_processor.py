@@ -14,6 +14,18 @@ from . import typography
 
 log = logging.getLogger("fb2_converter")
 
+# Generated XHTML has no namespace, tags are compared as they are.
+# h1..h5, p.subtitle is matched by class
+HEADING_TAGS = frozenset(f'h{i}' for i in range(1, 6))
+# Elements that don't take the spacing of a neighbouring <empty-line>
+# TODO: p.subtitle should be excluded too, but it isn't matched by tag
+SPACER_EXCL_TAGS = HEADING_TAGS | {'figure'}
+# Elements the passes in run() work on, found in a single walk over the body
+TARGET_TAGS = (*HEADING_TAGS, 'p', 'empty-line', 'sup')
+
+# Tags are queried one at a time: an element emptied by an earlier removal is caught by a later query
+EMPTY_ELEMENT_TAGS = ('p', 'div', 'span', 'em', 'strong')
+
 
 class PostProcessor():
     """
@@ -29,6 +41,7 @@ class PostProcessor():
     def run(self, xhtml_body: etree._Element):
         """Method to run for cleaning up the generated XHTML tree."""
         self.body = xhtml_body
+        self._collect_targets()
 
         if self.mode == ConversionMode.NOTE:
             self._fix_note_backlinks()
@@ -46,11 +59,38 @@ class PostProcessor():
             )
 
 
+    def _collect_targets(self):
+        """
+        Sorts the elements handled by the passes below into lists, in one walk.
+        The passes don't create such elements, and the lists let them modify the tree freely.
+        """
+        self._backlinks: list[etree._Element] = []
+        self._headings: list[etree._Element] = []
+        self._empty_lines: list[etree._Element] = []
+        self._sups: list[etree._Element] = []
+
+        tags = (*TARGET_TAGS, 'a') if self.mode == ConversionMode.NOTE else TARGET_TAGS
+        for el in self.body.iterdescendants(*tags):
+            tag = el.tag
+            if tag == 'p':
+                if el.get('class') == 'subtitle':
+                    self._headings.append(el)
+            elif tag == 'empty-line':
+                self._empty_lines.append(el)
+            elif tag == 'sup':
+                self._sups.append(el)
+            elif tag == 'a':
+                if el.get('class') == 'backlink':
+                    self._backlinks.append(el)
+            else:
+                self._headings.append(el)
+
+
     def _fix_note_backlinks(self):
         """Moves backlinks in footnotes inside the first `p or div`."""
-        for backlink in self.body.iterfind(".//a[@class='backlink']"):
+        for backlink in self._backlinks:
             next_el = backlink.getnext()
-            if next_el is not None and xu.get_tag_name(next_el) in ['p', 'div']:
+            if next_el is not None and next_el.tag in ('p', 'div'):
                 next_text = next_el.text
                 # move <p/div> text to backlink's tail
                 next_el.text = None
@@ -63,33 +103,34 @@ class PostProcessor():
         Strips unwanted formatting from headings.
         Strips `<p>`, unwraps its content. Multiple `<p>`s become `<span>`s with `<br/>`.
         """
-        # h1..h6, p.subtitle
-        heading_tags = [f'h{i}' for i in range(1, 6)]
-        heading_tags.append('p[@class="subtitle"]')
-        heading_query = " | ".join([f".//{tag}" for tag in heading_tags])
-        
-        for heading in self.body.xpath(heading_query):  # type: ignore
+        for heading in self._headings:
+            # Text-only headings have nothing to strip
+            if len(heading) == 0:
+                continue
+
             # 1. Strip bold/italic tags. // Leave italics intact?
             etree.strip_tags(heading, 'em', 'strong', 'b', 'i')
             
             # 2. Single <p>: unwrap directly
             if len(heading) == 1:
-                if xu.get_tag_name(heading[0]) == 'p':
+                if heading[0].tag == 'p':
                     xu.unwrap_element(heading[0], heading)
                 else:
-                    log.debug(f"Heading contains single non-<p> element: <{xu.get_tag_name(heading[0])}>")
+                    log.debug(f"Heading contains single non-<p> element: <{heading[0].tag}>")
 
             # 3. Multiple children: unwrap each <p> into <span> with <br/>
             elif len(heading) > 1:
-                for child in heading:
-                    if xu.get_tag_name(child) == 'p':
+                # Snapshot: the loop replaces children and adds <br/>s between them
+                children = list(heading)
+                last_child = children[-1]
+                for child in children:
+                    if child.tag == 'p':
                         span = xu.replace_tag(child, 'span')
                         # Insert <br/> after the span if not the last child
-                        if span != heading[-1]:
-                            br = etree.Element('br')
-                            heading.insert(heading.index(span) + 1, br)
+                        if child is not last_child:
+                            span.addnext(heading.makeelement('br'))
                     else:
-                        log.debug(f"Heading contains non-<p> element: <{xu.get_tag_name(child)}>")
+                        log.debug(f"Heading contains non-<p> element: <{child.tag}>")
 
 
     def _handle_empty_line(self):
@@ -98,29 +139,21 @@ class PostProcessor():
         Replaces `empty-line` with `class="space-after/before"` on a sibling element.
         Inside titles, replaces `empty-line` with `br`.
         """
-        target_tags = ('p', 'div')
-    
-        # h1..h6, p.subtitle
-        heading_tags = [f'h{i}' for i in range(1, 6)]
-        heading_tags.append('p[@class="subtitle"]') # TODO: this will not match 'if in' check
-        excl_tags = ['figure']
-        excl_tags.extend(heading_tags)
-
-        for empty_line in self.body.iterfind(".//empty-line"):
+        for empty_line in self._empty_lines:
             parent = empty_line.getparent()
             if parent is None: 
                 log.warning("<empty-line> has no parent. Skipping.")
                 continue
 
             # 1. Inside titles - convert to <br/> or remove
-            if xu.get_tag_name(parent) in heading_tags:
+            if parent.tag in HEADING_TAGS:
                 next_el = empty_line.getnext()
                 # If empty-line is the last child or is followed by another empty-line
-                if next_el is None or xu.get_tag_name(next_el) == 'empty-line':
+                if next_el is None or next_el.tag == 'empty-line':
                     parent.remove(empty_line)
                     continue          
                 
-                br = etree.Element('br')
+                br = parent.makeelement('br')
                 parent.replace(empty_line, br)
 
             # 2. As spacers between other elements
@@ -130,12 +163,12 @@ class PostProcessor():
                 cls = ""
 
                 # If previous element exists and is of valid type, use it
-                if target_el is not None and target_el.tag not in excl_tags:
+                if target_el is not None and target_el.tag not in SPACER_EXCL_TAGS:
                     cls = "space-after"
                 else:
                     # Otherwise, check the next element
                     next_el = empty_line.getnext()
-                    if next_el is not None and next_el.tag not in excl_tags:
+                    if next_el is not None and next_el.tag not in SPACER_EXCL_TAGS:
                         target_el = next_el
                         cls = "space-before"
 
@@ -153,7 +186,7 @@ class PostProcessor():
         """Removes `sup` from note references (unwrap `sup > a` and `a > sup`)."""
         # TODO: remove this method
         # class="noteref" doesn't exist at this stage, it's added later in EpubBuilder
-        for sup in self.body.iterfind('.//sup'):
+        for sup in self._sups:
             parent = sup.getparent()
             if parent is None: continue
             # a > sup
@@ -168,13 +201,27 @@ class PostProcessor():
 
     def _remove_empty_elements(self):
         """Removes empty elements."""
-        for tag in ['p', 'div', 'span', 'em', 'strong']:
-            # TODO: verify that xpath matches all empty elements without text
-            for el in self.body.xpath(f".//{tag}[not(node())]"):  # type: ignore
+        for tag in EMPTY_ELEMENT_TAGS:
+            # Matches XPath `.//tag[not(node())]` several times faster. The generated XHTML has
+            # no comments or PIs, and an empty text node reads as '' rather than None.
+            empty = [el for el in self.body.iterdescendants(tag) if el.text is None and len(el) == 0]
+            for el in empty:
                 parent = el.getparent()
-                if parent is not None:
-                    parent.remove(el)
-                    log.debug(f"Removed empty {el} from {parent}.")
+                if parent is None:
+                    continue
+                # remove() takes the tail along, so it's moved out first. Whitespace separates words too,
+                # it's only dropped when it would be all that's left of the parent, so that an emptied
+                # wrapper is removed as well.
+                tail = el.tail
+                if tail:
+                    prev = el.getprevious()
+                    if prev is not None:
+                        prev.tail = (prev.tail or '') + tail
+                    elif not (tail.isspace() and not parent.text and len(parent) == 1):
+                        parent.text = (parent.text or '') + tail
+                parent.remove(el)
+            if empty:
+                log.debug(f"Removed {len(empty)} empty <{tag}> elements.")
 
 
     @staticmethod
@@ -5,6 +5,9 @@ from lxml import etree
 DASHES = ('—', '–', '-')
 # Regex to find any trailing punctuation, including dashes
 PUNCTUATION_RE = re.compile(r'([.,:;?!' + "".join(DASHES) + r']+)$')
+# Compiled once, these run several times for every <p>
+WORD_CHAR_RE = re.compile(r'\w')
+WHITESPACE_RE = re.compile(r'\s')
 
 # TODO: apply NBSP and .nobreak inside sentences, not just at the start/end of <p>
 # Start of <p> is guaranteed to begin at a new line, nbsp is not needed there. 
@@ -35,7 +38,7 @@ def improve_typography(body: etree._Element, len_nbsp_range, len_nobreak_range):
     # 2. Wrap word in no-break span if length is within this range.
     # word_length_nobreak = (4, 7)
 
-    for p in body.iterfind(".//p"):
+    for p in body.iterdescendants('p'):
         # Join all text nodes and split by whitespace to get a word count
         all_text = " ".join(p.itertext()) # type: ignore
         words = all_text.split()
@@ -105,9 +108,9 @@ def _find_last_text_owner(element):
     # FIX: Find the last text node that contains an actual word character (\w).
     # This prevents stopping on nodes that only contain punctuation (e.g. "..." or "?").
     for node in nodes_in_reverse:
-        if node is not element and node.tail and re.search(r'\w', node.tail):
+        if node is not element and node.tail and WORD_CHAR_RE.search(node.tail):
             return node, 'tail'
-        if node.text and re.search(r'\w', node.text):
+        if node.text and WORD_CHAR_RE.search(node.text):
             return node, 'text'
             
     # Fallback: If no node with a word is found (e.g., paragraph is just "."),
@@ -210,7 +213,7 @@ def _find_next_separator_owner_recursive_up(element):
         return None, ''
         
     # Check next siblings
-    next_sibling = element.next_sibling
+    next_sibling = element.getnext()
     while next_sibling is not None:
         # Check sibling's text
         if next_sibling.text and next_sibling.text.lstrip() != next_sibling.text:
@@ -224,7 +227,7 @@ def _find_next_separator_owner_recursive_up(element):
         if next_sibling.tail and next_sibling.tail.lstrip() != next_sibling.tail:
             return next_sibling, 'tail'
             
-        next_sibling = next_sibling.next_sibling
+        next_sibling = next_sibling.getnext()
         
     # If no next siblings have it, check parent's tail
     if parent.tail and parent.tail.lstrip() != parent.tail:
@@ -246,7 +249,7 @@ def _process_first_word(p, len_nbsp_range, len_nobreak_range):
 
     # Find the first word and the separator that follows it.
     # The separator might be in this text node, or in the element's tail.
-    match = re.search(r'\s', stripped_text)
+    match = WHITESPACE_RE.search(stripped_text)
     
     separator_node_owner = None
     
@@ -301,8 +304,8 @@ def _process_first_word(p, len_nbsp_range, len_nobreak_range):
         
     # Apply modifications
     if needs_nobreak:
-        span = etree.Element('span')
-        span.set('class', 'nobreak')
+        # Created in the paragraph's document, cheaper than a standalone etree.Element
+        span = p.makeelement('span', {'class': 'nobreak'})
         span.text = first_word
 
         # The original text node is now just the leading whitespace
@@ -344,7 +347,7 @@ def _process_last_word(p, len_nbsp_range, len_nobreak_range):
 
     # If the last node is a tail with only punctuation, and the owner tag
     # itself has text, then process the tag's text and append the tail's content.
-    if attr == 'tail' and not re.search(r'\w', text_to_process) and owner.text and owner.text.strip():
+    if attr == 'tail' and not WORD_CHAR_RE.search(text_to_process) and owner.text and owner.text.strip():
         punctuation_from_tail = text_to_process
         text_to_process = owner.text + punctuation_from_tail
         attr_to_modify = 'text'
@@ -357,13 +360,16 @@ def _process_last_word(p, len_nbsp_range, len_nobreak_range):
     trailing_ws = lstripped_text[len(rstripped_text):]
     stripped_text = rstripped_text
 
-    matches = list(re.finditer(r'\s', stripped_text))
+    # Only the last whitespace is needed, scan back over the last word instead of matching them all
+    last_ws = len(stripped_text) - 1
+    while last_ws >= 0 and not stripped_text[last_ws].isspace():
+        last_ws -= 1
     
     sep_owner, sep_attr = None, ''
     sep_text_before = ""
     separator = ""
     
-    if not matches: # Word is standalone in this node
+    if last_ws < 0: # Word is standalone in this node
         last_word_with_punct = stripped_text
         text_before_word = ""
         
@@ -385,10 +391,9 @@ def _process_last_word(p, len_nbsp_range, len_nobreak_range):
     else:
         # Separator is inside this text node
         sep_owner, sep_attr = owner, attr_to_modify
-        last_match = matches[-1]
-        last_word_with_punct = stripped_text[last_match.end():]
-        separator = last_match.group(0)
-        text_before_word = stripped_text[:last_match.start()]
+        last_word_with_punct = stripped_text[last_ws + 1:]
+        separator = stripped_text[last_ws]
+        text_before_word = stripped_text[:last_ws]
         sep_text_before = leading_ws + text_before_word
         
     # --- Refactored Part ---
@@ -412,8 +417,8 @@ def _process_last_word(p, len_nbsp_range, len_nobreak_range):
             new_separator = separator.replace(' ', '\u00A0', 1)
 
     if needs_nobreak:
-        span = etree.Element('span')
-        span.set('class', 'nobreak')
+        # Created in the paragraph's document, cheaper than a standalone etree.Element
+        span = p.makeelement('span', {'class': 'nobreak'})
         span.text = last_word
         span.tail = punctuation + trailing_ws
         
@@ -423,7 +428,7 @@ def _process_last_word(p, len_nbsp_range, len_nobreak_range):
         
         # 2. Clear the word from its original node (if it's different from separator node)
         if sep_owner != owner or sep_attr != attr_to_modify:
-            if not matches: # Word was standalone in its node
+            if last_ws < 0: # Word was standalone in its node
                 setattr(owner, attr_to_modify, leading_ws) # Clear the word, keep leading ws
             else:
                 # This branch implies separator and word are in the same node,
@@ -72,6 +72,8 @@ class LocalizedTerms:
             lang = default_lang
         self.lang = lang or default_lang
         self.default_lang = default_lang    # used as a fallback in getters
+        # {(key, default): translation}, headings are looked up repeatedly per book
+        self._heading_cache: dict[tuple[str, str], str] = {}
 
         if not self.__class__._GENRES or not self.__class__._HEADINGS:
             log.debug("[LocalizedTerms] Missing terms. Loading from file.")
@@ -100,7 +102,12 @@ class LocalizedTerms:
 
     def get_heading(self, key, default=''):
         """Get a heading translation."""
-        return self._get_translation(self.__class__._HEADINGS, key, default)
+        cache_key = (key, default)
+        translation = self._heading_cache.get(cache_key)
+        if translation is None:
+            translation = self._get_translation(self.__class__._HEADINGS, key, default)
+            self._heading_cache[cache_key] = translation
+        return translation
 
 
     def get_all_headings(self, key, default=''):
@@ -6,11 +6,13 @@ from enum import Enum, auto
 from pathlib import Path
 
 
-@dataclass
+@dataclass(frozen=True)
 class ConversionConfig:
     """
     A container for all settings related to a conversion task.
     This object is created by the UI (CLI or GUI) and passed to the ConversionPipeline.
+    It is read-only: worker processes receive it once at startup and share it
+    between all files they convert. Use dataclasses.replace() to change settings.
     """
     # Args already have some defaults, 
     # but we're specifying sane defaults here as well
@@ -25,6 +27,10 @@ class ConversionConfig:
     word_len_nobreak_range: tuple[int, int] = (4, 6)
     custom_stylesheet: Path | None = None
     num_threads: int = 0    # 0 means auto-detect
+    # Threads serializing XHTML documents of one book, 0 means auto-detect
+    serialize_threads: int = 0
+    # Also write the unpacked EPUB next to the source (<name>_epub_temp) for inspection
+    keep_workspace: bool = False
 
 
 class ConversionMode(Enum):
@@ -0,0 +1,30 @@
+"""
+Multiprocessing helpers shared by the process pools
+(batch conversion and quick metadata reading).
+"""
+import multiprocessing
+import os
+import sys
+
+
+def available_cpus() -> int:
+    """Returns the number of CPUs this process may use, honoring affinity limits."""
+    if hasattr(os, "process_cpu_count"):    # Python 3.13+
+        return os.process_cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):    # Linux: respects taskset/cgroup cpusets
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def get_mp_context(preload: list[str]):
+    """
+    Returns the multiprocessing context for a worker pool.
+    Windows only supports 'spawn'. Elsewhere 'forkserver' is used: its server
+    imports the `preload` modules (and with them lxml, PIL, etc.) once,
+    so new workers don't have to re-import them.
+    """
+    if sys.platform == "win32":
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(preload)
+    return ctx
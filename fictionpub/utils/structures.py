@@ -55,7 +55,8 @@ def enforce_namedtuple_types(cls):
     return cls
 
 
-class ConvertedBody(NamedTuple):
+@dataclass(slots=True)
+class ConvertedBody():
     """Container for a single converted XHTML body, its title, attributes, and ID."""
     file_id: str
     title: str
@@ -100,6 +101,7 @@ class FileInfo():
 
     def __post_init__(self):
         self.filename = self.id + ".xhtml"
+        self.href_prefix = self.filename + "#"    # for links to elements inside the file
 
     def __lt__(self, other):
         return self._sort_key() < other._sort_key()
@@ -1,3 +1,6 @@
+import sys
+from functools import lru_cache
+
 from lxml import etree
 
 from .namespaces import Namespaces as NS
@@ -46,7 +49,14 @@ def get_metadata_tags(element: etree._Element, tag_list: list[str]) -> dict:
 
 def get_tag_name(element: etree._Element) -> str:
     """Returns tag name without a namespace prefix."""
-    return etree.QName(element.tag).localname
+    return _localname(element.tag)
+
+
+@lru_cache(maxsize=128)
+def _localname(tag: str) -> str:
+    """Strips the {namespace} part of a tag. Cached, books only use a few dozen tag names."""
+    # Interned, so comparisons with tag literals ('section', 'p', ...) match by identity
+    return sys.intern(tag.rpartition('}')[2])
 
 
 def copy_id(source: etree._Element, target: etree._Element):
@@ -57,7 +67,8 @@ def copy_id(source: etree._Element, target: etree._Element):
 
 def get_attrib_dict(element: etree._Element) -> dict[str, str]:
     """Returns a proper dictionary of element attributes."""
-    return {str(k): str(v) for k, v in element.attrib.items()} 
+    # lxml keys and values are already str, no per-item conversion needed
+    return dict(element.attrib)     # type: ignore
 
 
 def unwrap_element(element: etree._Element, parent: etree._Element):
@@ -80,7 +91,8 @@ def replace_tag(element: etree._Element, new_tag: str) -> etree._Element:
         raise ValueError(f"Element {element.tag} has no parent; cannot replace.")
     
     attrib = get_attrib_dict(element)
-    new_element = etree.Element(new_tag, attrib)
+    # Created in the parent's document, cheaper than a standalone etree.Element
+    new_element = parent.makeelement(new_tag, attrib)
     # Copy text 
     new_element.text = element.text
     for child in element:
@@ -0,0 +1,53 @@
+"""
+Tests for FB2Book parsing.
+"""
+import base64
+from pathlib import Path
+
+from fictionpub.core.fb2_book import FB2Book
+
+
+# 1x1 transparent GIF
+PIXEL = base64.b64encode(
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+).decode()
+
+
+def _write_fb2(path: Path, sections: str) -> Path:
+    path.write_text(
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0"'
+        ' xmlns:l="http://www.w3.org/1999/xlink">'
+        '<description><title-info><book-title>Test</book-title><lang>en</lang></title-info></description>'
+        f'{sections}'
+        '</FictionBook>',
+        encoding='utf-8'
+    )
+    return path
+
+
+def test_binary_referenced_by_later_body(tmp_path: Path):
+    """A binary placed between the main body and the notes body it's used in is kept."""
+    fb2 = _write_fb2(tmp_path / 'late_ref.fb2',
+        '<body><section><p>Text<a l:href="#n1" type="note">1</a></p></section></body>'
+        f'<binary id="pic.gif" content-type="image/gif">{PIXEL}</binary>'
+        f'<binary id="unused.gif" content-type="image/gif">{PIXEL}</binary>'
+        '<body name="notes"><section id="n1"><p>Note</p><image l:href="#pic.gif"/></section></body>'
+    )
+    book = FB2Book(fb2)
+    book.parse()
+
+    assert 'pic.gif' in book.binaries
+    assert 'unused.gif' not in book.binaries
+
+
+def test_binary_referenced_by_earlier_body(tmp_path: Path):
+    fb2 = _write_fb2(tmp_path / 'early_ref.fb2',
+        '<body><section><p>Text</p><image l:href="#pic.gif"/></section></body>'
+        f'<binary id="pic.gif" content-type="image/gif">{PIXEL}</binary>'
+    )
+    book = FB2Book(fb2)
+    book.parse()
+
+    assert 'pic.gif' in book.binaries